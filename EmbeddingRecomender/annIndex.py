@@ -0,0 +1,327 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+
+def normalize_embeddings(embeddings):
+    """
+    Returns a float32 copy of the embeddings with every row scaled to unit length,
+    so that a dot product between two rows is their cosine similarity.
+    Rows that are all zeros are left as zeros.
+    """
+    vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return vectors
+
+def top_k(scores, k):
+    """Returns the column indices and values of the k largest scores of every row, in decreasing order."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=scores.dtype)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+class ExactIndex:
+    """
+    Brute-force cosine similarity search over a pre-normalized float32 matrix.
+
+    A query is one matrix-vector product followed by np.argpartition, and the
+    index is never modified after construction, so it is safe to share
+    between concurrent queries.
+
+    Args:
+        embeddings (np.ndarray): One embedding per row.
+        normalized (bool, optional): Whether the rows already have unit length,
+            as in an artifact written by transE.save_embeddings. A float32
+            matrix or memmap is then searched as it is, without a copy.
+            Defaults to False, which keeps a normalized copy.
+    """
+
+    def __init__(self, embeddings, normalized=False):
+        self.vectors = np.asarray(embeddings, dtype=np.float32) if normalized else normalize_embeddings(embeddings)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def reconstruct(self, row):
+        """Returns the normalized embedding stored for a row."""
+        return self.vectors[row]
+
+    def search(self, queries, k):
+        """
+        Finds the k most similar rows for each query.
+
+        Args:
+            queries (np.ndarray): A single embedding or one embedding per row.
+            k (int): The number of neighbours to return per query.
+
+        Returns:
+            tuple: (indices, scores) arrays of shape (num_queries, k), ordered
+                by decreasing cosine similarity.
+        """
+        queries = normalize_embeddings(queries)
+        scores = queries @ self.vectors.T
+        return top_k(scores, k)
+
+def spherical_kmeans(vectors, n_clusters, iterations=20, rng=np.random, chunk_size=65536):
+    """
+    Clusters unit-length vectors by cosine similarity.
+
+    Args:
+        vectors (np.ndarray): Normalized float32 vectors, one per row.
+        n_clusters (int): The number of clusters.
+        iterations (int, optional): The number of Lloyd iterations.
+            Defaults to 20.
+        rng (np.random.RandomState, optional): Source of the initial centroids.
+            Defaults to NumPy's global generator.
+        chunk_size (int, optional): Rows assigned per matrix product, which
+            bounds the temporary memory. Defaults to 65536.
+
+    Returns:
+        np.ndarray: Normalized centroids, one per row.
+    """
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_clusters(vectors, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+
+        # Restart empty clusters from random points so every list stays in use
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_embeddings(sums)
+    return centroids
+
+def assign_clusters(vectors, centroids, chunk_size=65536):
+    """Returns the index of the most similar centroid for every vector."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        assignment[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignment
+
+class IVFIndex:
+    """
+    Approximate cosine similarity search with an inverted file index.
+
+    A k-means coarse quantizer splits the vectors into n_lists clusters, and a
+    query only scores the vectors of its n_probe nearest clusters. Raising
+    n_probe trades speed for recall; n_probe == n_lists is an exact search.
+    The vectors are stored grouped by cluster, so every probed list is a
+    contiguous slice.
+
+    Args:
+        n_lists (int, optional): The number of clusters. Defaults to None,
+            which uses the square root of the number of vectors.
+        n_probe (int, optional): The number of clusters scanned per query.
+            Defaults to 8.
+        iterations (int, optional): k-means iterations used by build.
+            Defaults to 20.
+        training_size (int, optional): The number of vectors sampled to train
+            the quantizer. Defaults to 256 per list.
+        seed (int, optional): Seed for the k-means initialization.
+            Defaults to None.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, iterations=20, training_size=None, seed=None):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.training_size = training_size
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+        self.list_vectors = None
+        self.positions = None
+
+    def __len__(self):
+        return 0 if self.list_ids is None else len(self.list_ids)
+
+    def build(self, embeddings):
+        """
+        Trains the coarse quantizer and fills the inverted lists.
+
+        Args:
+            embeddings (np.ndarray): One embedding per row.
+
+        Returns:
+            IVFIndex: The built index.
+        """
+        vectors = normalize_embeddings(embeddings)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.RandomState(self.seed)
+
+        training_size = self.training_size or 256 * n_lists
+        if training_size < len(vectors):
+            sample = vectors[rng.choice(len(vectors), training_size, replace=False)]
+        else:
+            sample = vectors
+        centroids = spherical_kmeans(sample, n_lists, self.iterations, rng)
+
+        assignment = assign_clusters(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=n_lists)
+        self._set_lists(centroids, np.concatenate([[0], np.cumsum(counts)]), order, vectors[order])
+        return self
+
+    def _set_lists(self, centroids, list_offsets, list_ids, list_vectors):
+        self.centroids = centroids
+        self.n_lists = len(centroids)
+        self.list_offsets = list_offsets.astype(np.int64)
+        self.list_ids = list_ids.astype(np.int64)
+        self.list_vectors = list_vectors
+        self.positions = np.empty_like(self.list_ids)
+        self.positions[self.list_ids] = np.arange(len(self.list_ids))
+
+    def reconstruct(self, row):
+        """Returns the normalized embedding stored for a row."""
+        return self.list_vectors[self.positions[row]]
+
+    def search(self, queries, k, n_probe=None):
+        """
+        Finds approximately the k most similar rows for each query.
+
+        Args:
+            queries (np.ndarray): A single embedding or one embedding per row.
+            k (int): The number of neighbours to return per query.
+            n_probe (int, optional): Overrides the number of clusters scanned.
+
+        Returns:
+            tuple: (indices, scores) arrays of shape (num_queries, k), ordered
+                by decreasing cosine similarity. When the probed lists hold
+                fewer than k vectors, the remaining slots are -1 with score -inf.
+        """
+        if self.centroids is None:
+            raise ValueError("The index has not been built yet.")
+        queries = normalize_embeddings(queries)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes, _ = top_k(queries @ self.centroids.T, n_probe)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            positions = np.concatenate([np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in lists])
+            candidate_scores = self.list_vectors[positions] @ queries[q]
+            best, best_scores = top_k(candidate_scores[None, :], k)
+            indices[q, :best.shape[1]] = self.list_ids[positions[best[0]]]
+            scores[q, :best.shape[1]] = best_scores[0]
+        return indices, scores
+
+    def save(self, path):
+        """Saves the index to a .npz file."""
+        if self.centroids is None:
+            raise ValueError("The index has not been built yet.")
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids,
+                 list_vectors=self.list_vectors, n_probe=self.n_probe)
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index written by save."""
+        with np.load(path) as data:
+            index = cls(n_probe=int(data['n_probe']))
+            index._set_lists(data['centroids'], data['list_offsets'], data['list_ids'], data['list_vectors'])
+        return index
+
+_worker_index = None
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+def _search_block(queries, k):
+    return _worker_index.search(queries, k)
+
+def search_blocks(index, queries, k, memory_budget_mb=256, processes=None):
+    """
+    Searches many queries in blocks whose similarity matrix fits a memory budget.
+
+    Each block is a single matrix-matrix product against the index. With
+    processes set, the blocks are spread over a process pool; the index is
+    sent to every worker once, when the worker starts.
+
+    Args:
+        index (ExactIndex or IVFIndex): The index to search.
+        queries (np.ndarray): One embedding per row.
+        k (int): The number of neighbours to return per query.
+        memory_budget_mb (float, optional): Upper bound on the size of one
+            block's float32 similarity matrix, per process. Defaults to 256.
+        processes (int, optional): The number of worker processes. Defaults
+            to None, which searches every block in this process.
+
+    Returns:
+        tuple: (indices, scores) arrays of shape (num_queries, k).
+    """
+    block_size = max(1, int(memory_budget_mb * 2 ** 20) // (4 * max(1, len(index))))
+    blocks = [queries[start:start + block_size] for start in range(0, len(queries), block_size)]
+    if not blocks:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+
+    if processes:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(index,)) as pool:
+            results = list(pool.map(_search_block, blocks, repeat(k)))
+    else:
+        results = [index.search(block, k) for block in blocks]
+    return np.vstack([indices for indices, _ in results]), np.vstack([scores for _, scores in results])
+
+def benchmark(embeddings, ann_index, k=10, n_queries=1000, n_probes=(1, 2, 4, 8, 16, 32), seed=0):
+    """
+    Compares an IVF index against exact search on recall@k and queries per second.
+
+    Queries are rows of the embeddings themselves, issued one at a time as
+    the recommender does.
+
+    Args:
+        embeddings (np.ndarray): The embeddings the index was built from.
+        ann_index (IVFIndex): The built index.
+        k (int, optional): The number of neighbours per query. Defaults to 10.
+        n_queries (int, optional): The number of sampled queries. Defaults to 1000.
+        n_probes (tuple, optional): The n_probe settings to measure.
+        seed (int, optional): Seed for sampling the queries. Defaults to 0.
+
+    Returns:
+        list: One dict per setting with keys "index", "n_probe", "recall" and "qps".
+    """
+    exact = ExactIndex(embeddings)
+    rng = np.random.RandomState(seed)
+    queries = exact.vectors[rng.choice(len(exact), min(n_queries, len(exact)), replace=False)]
+
+    start = time.perf_counter()
+    truth = np.vstack([exact.search(query, k)[0] for query in queries])
+    exact_seconds = time.perf_counter() - start
+    results = [{"index": "exact", "n_probe": None, "recall": 1.0, "qps": len(queries) / exact_seconds}]
+
+    for n_probe in n_probes:
+        if n_probe > ann_index.n_lists:
+            break
+        start = time.perf_counter()
+        found = np.vstack([ann_index.search(query, k, n_probe=n_probe)[0] for query in queries])
+        seconds = time.perf_counter() - start
+        hits = sum(len(np.intersect1d(t, f)) for t, f in zip(truth, found))
+        results.append({"index": "ivf", "n_probe": n_probe, "recall": hits / truth.size, "qps": len(queries) / seconds})
+
+    for result in results:
+        n_probe = '-' if result["n_probe"] is None else result["n_probe"]
+        print(f"{result['index']:>5}  n_probe={n_probe:>4}  recall@{k}={result['recall']:.3f}  QPS={result['qps']:.0f}")
+    return results
+
+
+if __name__ == "__main__":
+    import os
+    from transE import load_embeddings
+
+    embeddings_dir = 'embeddings'
+    embedding_index, node_embeddings, relation_embeddings = load_embeddings(embeddings_dir)
+
+    # One index per node label, matching the per-label recommenders in recomendationSystem.py
+    for label, entry in embedding_index['labels'].items():
+        ann_path = os.path.join(embeddings_dir, 'ivf_' + os.path.splitext(entry['file'])[0] + '.npz')
+        ann_index = IVFIndex(seed=0).build(node_embeddings[label])
+        ann_index.save(ann_path)
+        print(f"Successfully wrote an IVF index with {ann_index.n_lists} lists to {ann_path}")
+        benchmark(node_embeddings[label], ann_index)
@@ -0,0 +1,86 @@
+# Compares the mini-batch TransE trainer with the per-triple loop on a synthetic movie graph
+
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+
+from transE import TripleStore, TransEModel, train_transe_batched, train_transe_per_triple
+
+RELATIONS = ('GENRE_IS', 'DIRECTED_BY', 'ACTED_BY')
+
+def synthetic_triples(movies=600, genres=8, directors=60, actors=300, actors_per_movie=3, seed=0):
+    """
+    Builds a TripleStore shaped like the movie graph: every movie has one
+    genre, one director and actors_per_movie actors, drawn at random.
+    """
+    rng = np.random.RandomState(seed)
+    sizes = (genres, directors, actors)
+    offsets = np.cumsum((movies,) + sizes[:-1])
+    heads, relations, tails = [], [], []
+    for movie in range(movies):
+        for relation, (offset, size, count) in enumerate(zip(offsets, sizes, (1, 1, actors_per_movie))):
+            for tail in rng.choice(size, count, replace=False):
+                heads.append(movie)
+                relations.append(relation)
+                tails.append(offset + tail)
+
+    labels = ['Movie'] * movies + ['Genre'] * genres + ['Director'] * directors + ['Actor'] * actors
+    node_ids = [f'{label}:{i}' for i, label in enumerate(labels)]
+    return TripleStore(heads, relations, tails, node_ids, list(RELATIONS), node_ids, np.ones(len(node_ids), dtype=bool),
+                       list(range(len(heads))), labels)
+
+def tail_ranks(model, triples):
+    """The rank of the true tail of every triple among all non-movie nodes, by TransE distance (1 is best)."""
+    candidates = np.flatnonzero(np.array(triples.node_labels) != 'Movie')
+    ranks = np.empty(len(triples), dtype=np.int64)
+    for i, (h, r, t) in enumerate(zip(triples.heads, triples.relations, triples.tails)):
+        distances = model.score(h, r, candidates)
+        ranks[i] = (distances < model.score(h, r, t)).sum() + 1
+    return ranks
+
+def check(epochs=50, batch_size=1024, seed=0):
+    """Trains both modes with the same seed and settings and asserts the batched embeddings rank tails as well."""
+    triples = synthetic_triples(seed=seed)
+    results = {}
+    for name, mode_batch_size in (('per-triple', None), ('batched', batch_size)):
+        model = TransEModel(epochs=epochs, batch_size=mode_batch_size, seed=seed)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.fit(triples)
+        ranks = tail_ranks(model, triples)
+        results[name] = (ranks.mean(), (ranks <= 10).mean())
+        print(f'{name}: {time.perf_counter() - started:.1f}s, final loss {model.losses[-1]:.1f}, '
+              f'mean rank {ranks.mean():.2f}, hits@10 {(ranks <= 10).mean():.3f}')
+    assert results['batched'][1] >= results['per-triple'][1] - 0.02, results
+
+def bench(nodes=200000, triples=300000, embedding_dim=100, batch_size=1024, seed=0):
+    """Times one epoch of each mode on a random graph of the given size."""
+    rng = np.random.RandomState(seed)
+    heads = rng.randint(nodes, size=triples).astype(np.int32)
+    relations = rng.randint(len(RELATIONS), size=triples).astype(np.int32)
+    tails = rng.randint(nodes, size=triples).astype(np.int32)
+    for name, train, kwargs in (('per-triple', train_transe_per_triple, {}), ('batched', train_transe_batched, {'batch_size': batch_size})):
+        node_embeddings = rng.rand(nodes, embedding_dim)
+        relation_embeddings = rng.rand(len(RELATIONS), embedding_dim)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            train(heads, relations, tails, node_embeddings, relation_embeddings, epochs=1, rng=np.random.RandomState(seed), **kwargs)
+        print(f'{name}: {time.perf_counter() - started:.1f}s per epoch on {nodes} nodes and {triples} triples')
+
+if __name__ == '__main__':
+    # python benchTransE.py          checks the batched trainer's quality against the per-triple loop
+    # python benchTransE.py bench    times one epoch of each on a 200k node, 300k triple graph
+    parser = argparse.ArgumentParser(description='Checks and times the TransE training modes.')
+    parser.add_argument('command', nargs='?', choices=('check', 'bench'), default='check')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--nodes', type=int, default=200000)
+    parser.add_argument('--triples', type=int, default=300000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.command == 'check':
+        check(args.epochs, args.batch_size, args.seed)
+    else:
+        bench(args.nodes, args.triples, batch_size=args.batch_size, seed=args.seed)
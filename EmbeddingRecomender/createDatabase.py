@@ -1,64 +1,120 @@
 import json
 import csv
+import os
+
+def iter_json_items(path, key):
+    """
+    Yields item[key] for every item of a JSON export, one at a time.
+
+    A .jsonl or .ndjson file is read line by line. A JSON array is parsed
+    incrementally with ijson when it is installed, so only one item is in
+    memory at a time; without ijson the whole array is loaded, with a warning.
+
+    Args:
+        path (str): Path to the JSON or JSON Lines file.
+        key (str): The key holding the node or relation in each item ("n" or "r").
+    """
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)[key]
+        return
+
+    try:
+        import ijson
+    except ImportError:
+        print(f"Warning: ijson is not installed, so {path} is loaded into memory whole. Run 'pip install ijson' to stream it.")
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for item in json.load(f):
+                yield item[key]
+        return
+
+    with open(path, 'rb') as f:
+        # ijson reads bytes, so skip the byte order mark that utf-8-sig would drop
+        if f.read(3) != b'\xef\xbb\xbf':
+            f.seek(0)
+        try:
+            yield from ijson.items(f, 'item.' + key, use_float=True)
+        except ijson.JSONError as e:
+            # A ValueError like json.JSONDecodeError, with ijson's multi-line message cut to its first line
+            raise ValueError(f"{path}: {str(e).splitlines()[0]} near byte {f.tell()}") from e
+
+def read_node_names(nodes_file):
+    """
+    Returns a compact elementId -> name map of every node, leaving the rest of
+    each node object behind. Nodes without a name map to 'Unknown'.
+    """
+    names = {}
+    for node in iter_json_items(nodes_file, 'n'):
+        name = node.get('properties', {}).get('name', 'Unknown')
+        # Kept as parsed for the csv writer, which writes a null name as an empty cell
+        names[node['elementId']] = '' if name is None else name
+    return names
 
 def create_csv_from_json(relations_file, nodes_file, output_file="output.csv"):
     """
     Reads relations and nodes from JSON files, and creates a CSV file
     with columns "start node", "relation", and "end node".
 
+    The exports are streamed (see iter_json_items): only the names of the
+    nodes are kept, and a row is written as soon as its relation is read, so
+    memory grows with the number of nodes rather than the size of the export.
+
     Args:
         relations_file (str): Path to the relations JSON file.
         nodes_file (str): Path to the nodes JSON file.
         output_file (str, optional): Path to the output CSV file.
             Defaults to "output.csv".
+
+    Returns:
+        bool: Whether the CSV file was written.
     """
     try:
-        with open(relations_file, 'r', encoding='utf-8-sig') as f_relations, \
-             open(nodes_file, 'r', encoding='utf-8-sig') as f_nodes:
-            relations_data = json.load(f_relations)
-            nodes_data = json.load(f_nodes)
+        node_names = read_node_names(nodes_file)
     except FileNotFoundError as e:
         print(f"Error: {e}")
-        return
-    except json.JSONDecodeError as e:
+        return False
+    except ValueError as e:
         print(f"Error: Invalid JSON: {e}")
-        return
-
-    # Create a dictionary to store node information using elementId as key for faster lookup
-    node_dict = {node['n']['elementId']: node['n'] for node in nodes_data}
-
-    # Prepare data for CSV
-    csv_data = []
-    for relation_item in relations_data:
-        relation = relation_item['r']
-        start_node_element_id = relation['startNodeElementId']
-        end_node_element_id = relation['endNodeElementId']
+        return False
 
-        # Check if start and end nodes exist
-        if start_node_element_id in node_dict and end_node_element_id in node_dict:
-            start_node_name = node_dict[start_node_element_id]['properties'].get('name', 'Unknown')  #handles the cases where a node doesn't have a name.
-            end_node_name = node_dict[end_node_element_id]['properties'].get('name', 'Unknown')    #handles the cases where a node doesn't have a name.
-            csv_data.append({
-                "start node": start_node_name,
-                "relation": relation['type'],
-                "end node": end_node_name
-            })
-        else:
-            print(f"Warning: Skipping relation with ID {relation['identity']} as start or end node was not found.")
+    # The output is only created once there is a valid relation to write
+    csvfile = None
+    try:
+        for relation in iter_json_items(relations_file, 'r'):
+            start_node_name = node_names.get(relation['startNodeElementId'])
+            end_node_name = node_names.get(relation['endNodeElementId'])
 
-    if not csv_data:
-        print("No valid relations found to write to CSV.")
-        return
+            # Check if start and end nodes exist
+            if start_node_name is None or end_node_name is None:
+                print(f"Warning: Skipping relation with ID {relation['identity']} as start or end node was not found.")
+                continue
 
-    # Write to CSV
-    try:
-        with open(output_file, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=["start node", "relation", "end node"])
-            writer.writeheader()
-            writer.writerows(csv_data)
-        print(f"Successfully wrote data to {output_file}")
+            if csvfile is None:
+                csvfile = open(output_file, 'w', newline='')
+                writer = csv.writer(csvfile)
+                writer.writerow(["start node", "relation", "end node"])
+            writer.writerow([start_node_name, relation['type'], end_node_name])
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}" if isinstance(e, FileNotFoundError) else f"Error: Invalid JSON: {e}")
+        # Leave no partial CSV behind, as when the whole file was parsed first
+        if csvfile is not None:
+            csvfile.close()
+            os.remove(output_file)
+        return False
     except Exception as e:
         print(f"Error writing to CSV file: {e}")
+        if csvfile is not None:
+            csvfile.close()
+        return False
+
+    if csvfile is None:
+        print("No valid relations found to write to CSV.")
+        return False
+    csvfile.close()
+    print(f"Successfully wrote data to {output_file}")
+    return True
 
 if __name__ == "__main__":
     relations_file = '/content/relations.json'  # Replace with your actual file name
@@ -1,50 +1,173 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 from IPython.display import HTML, display
-import json  # To safely parse the string embeddings
-
-# Load the output.csv file
-try:
-    movie_df = pd.read_csv('output.csv')
-except FileNotFoundError:
-    print("Error: 'output.csv' not found. Please make sure the file is in the same directory as your Colab notebook or provide the correct path.")
-    exit()
-
-# Assuming your CSV has columns named 'start node' and 'start node embedding'
-# You might need to adjust these names based on your actual CSV structure
-if 'start node' not in movie_df.columns or 'start node embedding' not in movie_df.columns:
-    print("Error: The CSV file must contain columns named 'start node' and 'start node embedding'. Please check your file.")
-    exit()
-
-# Rename columns for clarity
-movie_df.rename(columns={'start node': 'title', 'start node embedding': 'embedding_str'}, inplace=True)
-
-# Function to safely parse the string embedding into a list of floats
-def parse_embedding(embedding_str):
-    try:
-        return json.loads(embedding_str)
-    except (TypeError, json.JSONDecodeError):
-        return None
+from flask import Flask, jsonify, request
+import json
+import os
+
+from annIndex import ExactIndex, IVFIndex, search_blocks
+from transE import load_embeddings
+
+class MovieRecommender:
+    """
+    Looks up titles and returns their nearest neighbours in embedding space.
+
+    Args:
+        titles (list): The title of every embedding row.
+        embeddings (np.ndarray): One embedding per title.
+        index (optional): A search index over the same rows with the
+            ExactIndex interface, such as an annIndex.IVFIndex. Defaults to
+            None, which builds an ExactIndex.
+        normalized (bool, optional): Whether the embeddings rows already have
+            unit length, so the ExactIndex uses them without a copy. Defaults to False.
+    """
+
+    def __init__(self, titles, embeddings, index=None, normalized=False):
+        self.titles = np.asarray(titles, dtype=object)
+        self.index = index if index is not None else ExactIndex(embeddings, normalized)
+        # The rows of every distinct title, grouped by title code, found with pandas' hash tables rather than a Python dict
+        codes, uniques = pd.factorize(self.titles, use_na_sentinel=False)
+        self.title_codes = pd.Index(uniques)
+        self.rows_by_title = np.argsort(codes, kind='stable')
+        self.title_offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(uniques)))])
+
+    def title_rows(self, title):
+        """Returns the rows holding title in increasing order, or None when it is unknown."""
+        try:
+            code = self.title_codes.get_loc(title)
+        except (KeyError, TypeError):
+            return None
+        return self.rows_by_title[self.title_offsets[code]:self.title_offsets[code + 1]]
+
+    def similar_movies(self, movie_title, top_n=10):
+        """
+        Returns up to top_n titles most similar to movie_title, excluding the title itself.
+        """
+        rows = self.title_rows(movie_title)
+        if rows is None:
+            return "Movie not found in the database."
+
+        # Ask for enough extra neighbours to cover the rows that share the input title
+        indices, _ = self.index.search(self.index.reconstruct(rows[0]), top_n + len(rows))
+        similar = [self.titles[i] for i in indices[0] if i >= 0 and self.titles[i] != movie_title]
+        return similar[:top_n]
+
+    def similar_movies_batch(self, titles, top_n=10, memory_budget_mb=256, processes=None):
+        """
+        Finds the top_n most similar rows for many titles at once.
+
+        The similarities are computed block by block with matrix-matrix
+        products sized to memory_budget_mb, optionally across a process pool.
 
-# Apply the parsing function to the embedding string column
-movie_df['embedding'] = movie_df['embedding_str'].apply(parse_embedding)
-movie_df.dropna(subset=['embedding'], inplace=True) # Remove rows with unparseable embeddings
+        Args:
+            titles (list): The titles to look up.
+            top_n (int, optional): The number of neighbours per title.
+                Defaults to 10.
+            memory_budget_mb (float, optional): Upper bound on the size of one
+                block's similarity matrix. Defaults to 256.
+            processes (int, optional): The number of worker processes.
+                Defaults to None, which runs in this process.
 
-def get_similar_movies_df(movie_title, df, top_n=10):
-    if movie_title not in df['title'].values:
-        return "Movie not found in the database."
+        Returns:
+            tuple: (indices, scores) arrays of shape (len(titles), top_n).
+                Indices are rows of self.titles, excluding rows with the
+                queried title; unknown titles and unfilled slots are -1 with
+                score -inf.
+        """
+        titles = list(titles)
+        title_rows = [self.title_rows(title) for title in titles]
+        known = [rows is not None for rows in title_rows]
+        query_rows = [rows[0] for rows in title_rows if rows is not None]
 
-    target_embedding = df[df['title'] == movie_title]['embedding'].iloc[0]
+        indices = np.full((len(titles), top_n), -1, dtype=np.int64)
+        scores = np.full((len(titles), top_n), -np.inf, dtype=np.float32)
+        if not query_rows:
+            return indices, scores
 
-    # Calculate cosine similarities
-    df['similarity'] = df['embedding'].apply(lambda x: cosine_similarity([target_embedding], [x])[0][0])
+        # Ask for enough extra neighbours to cover the rows that share each input title
+        extra = max(len(rows) for rows in title_rows if rows is not None)
+        found_indices, found_scores = search_blocks(self.index, self.index.reconstruct(np.array(query_rows)),
+                                                     top_n + extra, memory_budget_mb, processes)
 
-    # Sort by similarity and get the top N similar movies (excluding the input movie itself)
-    similar_movies_df = df[df['title'] != movie_title].sort_values(by='similarity', ascending=False).head(top_n)
-    return similar_movies_df['title'].tolist()
+        query_titles = np.array([title for title, found in zip(titles, known) if found], dtype=object)
+        drop = (found_indices < 0) | (self.titles[np.maximum(found_indices, 0)] == query_titles[:, None])
+        keep = np.argsort(drop, axis=1, kind='stable')[:, :top_n]
+        kept_indices = np.take_along_axis(found_indices, keep, axis=1)
+        kept_scores = np.take_along_axis(found_scores, keep, axis=1)
+        kept_drop = np.take_along_axis(drop, keep, axis=1)
+        kept_indices[kept_drop] = -1
+        kept_scores[kept_drop] = -np.inf
 
-def display_movie_recommendation_interface(movie_list):
-    html = """
+        indices[np.array(known)] = kept_indices
+        scores[np.array(known)] = kept_scores
+        return indices, scores
+
+def get_similar_movies_df(movie_title, recommender, top_n=10):
+    return recommender.similar_movies(movie_title, top_n)
+
+def build_entity_table(embedding_index):
+    """
+    Builds one row per unique node, keyed by Neo4j elementId and label.
+
+    Args:
+        embedding_index (dict): The index.json of an embedding artifact.
+
+    Returns:
+        pd.DataFrame: Columns "id", "title", "label" and "row", where "row"
+            is the node's row in the embedding matrix of its label.
+    """
+    entity_df = pd.concat([
+        pd.DataFrame({
+            'id': entry['ids'],
+            'title': entry['names'],
+            'label': label,
+            'row': np.arange(len(entry['ids']))
+        })
+        for label, entry in embedding_index['labels'].items()
+    ], ignore_index=True)
+    return entity_df.drop_duplicates(subset=['id', 'label']).reset_index(drop=True)
+
+def build_recommenders(entity_df, embedding_index, node_embeddings, directory="embeddings"):
+    """
+    Builds one recommender per node label, so a query only scores nodes of that label.
+
+    An IVF index written by annIndex.py for a label (ivf_<Label>.npz) is used
+    when present, otherwise the label gets exact search. The rows of an
+    artifact are unique per label and normalized, so exact search runs on the
+    memory-mapped matrix itself.
+
+    Args:
+        entity_df (pd.DataFrame): The table returned by build_entity_table.
+        embedding_index (dict): The index.json of the embedding artifact.
+        node_embeddings (dict): The node embedding matrices keyed by label.
+        directory (str, optional): Directory holding the artifact.
+            Defaults to "embeddings".
+
+    Returns:
+        dict: A MovieRecommender per label.
+    """
+    recommenders = {}
+    for label, nodes in entity_df.groupby('label', sort=False):
+        ann_path = os.path.join(directory, 'ivf_' + os.path.splitext(embedding_index['labels'][label]['file'])[0] + '.npz')
+        ann_index = None
+        if os.path.exists(ann_path):
+            ann_index = IVFIndex.load(ann_path)
+            if len(ann_index) != len(nodes):
+                print(f"Warning: '{ann_path}' does not match the embeddings, falling back to exact search.")
+                ann_index = None
+
+        if ann_index is None:
+            embeddings, rows = node_embeddings[label], nodes['row'].to_numpy()
+            if not np.array_equal(rows, np.arange(len(embeddings))):
+                embeddings = embeddings[rows]
+            recommenders[label] = MovieRecommender(nodes['title'], embeddings, normalized=embedding_index.get('normalized', False))
+        else:
+            recommenders[label] = MovieRecommender(nodes['title'], None, ann_index)
+    return recommenders
+
+def recommendation_page(endpoint="/similar"):
+    """Returns the recommendation interface, which fetches the top titles from endpoint."""
+    return """
     <!DOCTYPE html>
     <html>
     <head>
@@ -80,36 +203,14 @@ def display_movie_recommendation_interface(movie_list):
         </div>
 
         <script>
-            const movies = """ + json.dumps(movie_list) + """;
-            const getSimilarMoviesJS = (targetMovie, allMovies, topN = 9) => {
-                if (!allMovies.some(movie => movie.title === targetMovie)) {
-                    return "Movie not found in the database.";
-                }
-
-                const targetEmbedding = allMovies.find(movie => movie.title === targetMovie).embedding;
-
-                const withSimilarity = allMovies.map(movie => {
-                    if (movie.title === targetMovie || movie.embedding === null || targetEmbedding === null) {
-                        return {...movie, similarity: -1}; // Avoid recommending the same movie or comparing with null embeddings
-                    }
-
-                    let dotProduct = 0;
-                    let normA = 0;
-                    let normB = 0;
-                    for (let i = 0; i < Math.min(targetEmbedding.length, movie.embedding.length); i++) {
-                        dotProduct += targetEmbedding[i] * movie.embedding[i];
-                        normA += Math.pow(targetEmbedding[i], 2);
-                        normB += Math.pow(movie.embedding[i], 2);
-                    }
-                    const similarity = dotProduct / (Math.sqrt(normA) * Math.sqrt(normB));
-                    return {...movie, similarity: similarity};
-                });
-
-                const sortedMovies = withSimilarity.sort((a, b) => b.similarity - a.similarity);
-                return sortedMovies.slice(1, topN + 1).map(movie => movie.title);
+            const endpoint = """ + json.dumps(endpoint) + """;
+            const getSimilarMoviesJS = async (targetMovie, topN = 9) => {
+                const response = await fetch(endpoint + "?title=" + encodeURIComponent(targetMovie) + "&k=" + topN);
+                const data = await response.json();
+                return response.ok ? data.similar : data.error;
             };
 
-            function getRecommendations() {
+            async function getRecommendations() {
                 const movieInput = document.getElementById("movieInput").value;
                 const recommendationsDiv = document.getElementById("recommendations");
                 const rank1List = document.getElementById("rank1-list");
@@ -119,7 +220,7 @@ def display_movie_recommendation_interface(movie_list):
                 rank2List.innerHTML = "";
                 rank3List.innerHTML = "";
 
-                const similarMovies = getSimilarMoviesJS(movieInput, movies);
+                const similarMovies = await getSimilarMoviesJS(movieInput);
 
                 if (typeof similarMovies === 'string') {
                     rank1List.innerHTML = `<li style="color: red;">${similarMovies}</li>`;
@@ -157,12 +258,71 @@ def display_movie_recommendation_interface(movie_list):
     </body>
     </html>
     """
-    display(HTML(html))
-
-# Prepare the movie data in a format suitable for the JavaScript function
-if 'title' in movie_df.columns and 'embedding' in movie_df.columns:
-    movie_data_for_js = movie_df[['title', 'embedding']].to_dict('records')
-    # Display the HTML interface only if the DataFrame is properly loaded and processed
-    display_movie_recommendation_interface(movie_data_for_js)
-else:
-    print("Error: Could not prepare movie data for the interface. Ensure 'title' and 'embedding' columns exist.")
\ No newline at end of file
+
+def display_movie_recommendation_interface(endpoint="http://localhost:8001/similar"):
+    display(HTML(recommendation_page(endpoint)))
+
+def create_app(recommenders, max_results=100):
+    """
+    Creates the Flask app serving the interface and a JSON similarity endpoint.
+
+    GET /similar?title=<title>&k=<k>&label=<label> returns
+    {"title": ..., "label": ..., "similar": [...]} computed on the server, so
+    the browser never receives any embeddings.
+
+    Args:
+        recommenders (dict): A MovieRecommender per label, as returned by build_recommenders.
+        max_results (int, optional): Upper bound on k. Defaults to 100.
+
+    Returns:
+        Flask: The app.
+    """
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        return recommendation_page('/similar')
+
+    @app.route('/similar')
+    def similar():
+        title = request.args.get('title', '')
+        label = request.args.get('label', 'Movie')
+        k = min(max(request.args.get('k', 9, type=int), 1), max_results)
+
+        if label not in recommenders:
+            return jsonify(error=f"Unknown label {label}."), 404
+        similar_movies = recommenders[label].similar_movies(title, k)
+        if isinstance(similar_movies, str):
+            return jsonify(error=similar_movies), 404
+        return jsonify(title=title, label=label, similar=similar_movies)
+
+    # Lets display_movie_recommendation_interface call the endpoint from a notebook page
+    @app.after_request
+    def allow_cross_origin(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    return app
+
+def main(directory="embeddings", port=8001):
+    """
+    Loads the embedding artifact written by doTransE.py from directory and
+    serves the recommendation app on port. The matrices are memory-mapped,
+    not parsed.
+    """
+    try:
+        embedding_index, node_embeddings, relation_embeddings = load_embeddings(directory)
+    except FileNotFoundError:
+        print(f"Error: '{os.path.join(directory, 'index.json')}' not found. Please run doTransE.py first or provide the correct path.")
+        return
+
+    entity_df = build_entity_table(embedding_index)
+    recommenders = build_recommenders(entity_df, embedding_index, node_embeddings, directory)
+    if 'Movie' not in recommenders:
+        print("Error: The embeddings do not contain any Movie nodes.")
+        return
+
+    create_app(recommenders).run(port=port)
+
+if __name__ == '__main__':
+    main('embeddings')
@@ -0,0 +1,456 @@
+import json
+import os
+import re
+import numpy as np
+
+from annIndex import normalize_embeddings
+
+class TripleStore:
+    """
+    Pre-indexed knowledge graph triples.
+
+    Triples are held as int32 (head, relation, tail) index arrays together with
+    the node and relation vocabularies, so the JSON exports only have to be
+    parsed and indexed once. The store can be saved to and loaded from a
+    single .npz file.
+
+    Args:
+        heads (np.ndarray): Head node index of every triple.
+        relations (np.ndarray): Relation type index of every triple.
+        tails (np.ndarray): Tail node index of every triple.
+        node_ids (list): Neo4j elementId of every node, in index order.
+        relation_types (list): Relation type of every relation index.
+        node_names (list): Display name of every node.
+        node_known (np.ndarray): Whether each node was present in nodes.json.
+        triple_ids (list): Neo4j identity of every triple.
+        node_labels (list, optional): Neo4j label of every node (Movie, Actor,
+            Director, Genre). Defaults to "Unknown" for every node.
+    """
+
+    def __init__(self, heads, relations, tails, node_ids, relation_types, node_names, node_known, triple_ids, node_labels=None):
+        self.heads = np.asarray(heads, dtype=np.int32)
+        self.relations = np.asarray(relations, dtype=np.int32)
+        self.tails = np.asarray(tails, dtype=np.int32)
+        self.node_ids = list(node_ids)
+        self.relation_types = list(relation_types)
+        self.node_names = list(node_names)
+        self.node_known = np.asarray(node_known, dtype=bool)
+        self.triple_ids = list(triple_ids)
+        self.node_labels = list(node_labels) if node_labels is not None else ['Unknown'] * len(self.node_ids)
+        self.node_id_to_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.relation_type_to_index = {relation_type: i for i, relation_type in enumerate(self.relation_types)}
+
+    def __len__(self):
+        return len(self.heads)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_relations(self):
+        return len(self.relation_types)
+
+    @classmethod
+    def from_records(cls, relations_data, nodes_data):
+        """
+        Indexes parsed Neo4j relation and node exports.
+
+        Args:
+            relations_data (list): Items of the form {"r": relationship}.
+            nodes_data (list): Items of the form {"n": node}.
+
+        Returns:
+            TripleStore: The indexed triples.
+        """
+        node_dict = {node['n']['elementId']: node['n'] for node in nodes_data}
+
+        node_id_to_index = {}
+        relation_type_to_index = {}
+        heads, relations, tails, triple_ids = [], [], [], []
+        for relation_item in relations_data:
+            relation = relation_item['r']
+            heads.append(node_id_to_index.setdefault(relation['startNodeElementId'], len(node_id_to_index)))
+            relations.append(relation_type_to_index.setdefault(relation['type'], len(relation_type_to_index)))
+            tails.append(node_id_to_index.setdefault(relation['endNodeElementId'], len(node_id_to_index)))
+            triple_ids.append(relation['identity'])
+
+        node_ids = list(node_id_to_index)
+        node_known = [node_id in node_dict for node_id in node_ids]
+        node_names = [node_dict[node_id]['properties'].get('name', 'Unknown') if known else ''
+                      for node_id, known in zip(node_ids, node_known)]
+        node_labels = [(node_dict[node_id].get('labels') or ['Unknown'])[0] if known else 'Unknown'
+                       for node_id, known in zip(node_ids, node_known)]
+
+        return cls(heads, relations, tails, node_ids, list(relation_type_to_index), node_names, node_known, triple_ids, node_labels)
+
+    @classmethod
+    def from_json(cls, relations_file, nodes_file):
+        """
+        Reads and indexes relations and nodes from Neo4j JSON exports.
+
+        Args:
+            relations_file (str): Path to the relations JSON file.
+            nodes_file (str): Path to the nodes JSON file.
+
+        Returns:
+            TripleStore: The indexed triples.
+        """
+        with open(relations_file, 'r', encoding='utf-8-sig') as f_relations, \
+             open(nodes_file, 'r', encoding='utf-8-sig') as f_nodes:
+            relations_data = json.load(f_relations)
+            nodes_data = json.load(f_nodes)
+        return cls.from_records(relations_data, nodes_data)
+
+    def save(self, path):
+        """Saves the store to a .npz file."""
+        np.savez(path, heads=self.heads, relations=self.relations, tails=self.tails,
+                 node_ids=np.array(self.node_ids, dtype=str), relation_types=np.array(self.relation_types, dtype=str),
+                 node_names=np.array(self.node_names, dtype=str), node_known=self.node_known,
+                 triple_ids=np.array(self.triple_ids), node_labels=np.array(self.node_labels, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """Loads a store written by save."""
+        with np.load(path) as data:
+            return cls(data['heads'], data['relations'], data['tails'], data['node_ids'].tolist(),
+                       data['relation_types'].tolist(), data['node_names'].tolist(), data['node_known'],
+                       data['triple_ids'].tolist(), data['node_labels'].tolist())
+
+
+def train_transe_per_triple(heads, relations, tails, node_embeddings, relation_embeddings, epochs=500, learning_rate=0.1, margin=1.0, rng=np.random):
+    """
+    Trains TransE embeddings in place, one triple at a time in store order.
+
+    Args:
+        heads (np.ndarray): int32 array of head node indices.
+        relations (np.ndarray): int32 array of relation type indices.
+        tails (np.ndarray): int32 array of tail node indices.
+        node_embeddings (np.ndarray): Node embedding matrix, updated in place.
+        relation_embeddings (np.ndarray): Relation embedding matrix, updated in place.
+        epochs (int, optional): The number of training epochs.
+            Defaults to 500.
+        learning_rate (float, optional): The learning rate for the optimization.
+            Defaults to 0.1.
+        margin (float, optional): The margin used in the TransE loss function.
+            Defaults to 1.0.
+        rng (np.random.RandomState, optional): Source of negative samples.
+            Defaults to NumPy's global generator.
+
+    Returns:
+        list: The total loss of every epoch.
+    """
+    num_nodes = len(node_embeddings)
+    losses = []
+
+    for epoch in range(epochs):
+        total_loss = 0
+        for start_node_index, relation_type_index, end_node_index in zip(heads, relations, tails):
+            # Get embeddings
+            start_node_embedding = node_embeddings[start_node_index]
+            end_node_embedding = node_embeddings[end_node_index]
+            relation_embedding = relation_embeddings[relation_type_index]
+
+            # Calculate the TransE distance
+            distance = np.linalg.norm(start_node_embedding + relation_embedding - end_node_embedding)
+
+            # Generate a corrupted triple for negative sampling
+            corrupted_end_node_index = rng.randint(num_nodes)
+            while corrupted_end_node_index == end_node_index:
+                corrupted_end_node_index = rng.randint(num_nodes)
+            corrupted_end_node_embedding = node_embeddings[corrupted_end_node_index]
+            corrupted_distance = np.linalg.norm(start_node_embedding + relation_embedding - corrupted_end_node_embedding)
+
+            # Calculate the TransE loss
+            loss = max(0, margin + distance - corrupted_distance)
+            total_loss += loss
+
+            # Update embeddings (simplified gradient descent)
+            if loss > 0:
+                grad_start = 2 * (start_node_embedding + relation_embedding - end_node_embedding)
+                grad_relation = 2 * (start_node_embedding + relation_embedding - end_node_embedding)
+                grad_end = -2 * (start_node_embedding + relation_embedding - end_node_embedding)
+                grad_corrupted_end = 2 * (start_node_embedding + relation_embedding - corrupted_end_node_embedding)
+
+                node_embeddings[start_node_index] -= learning_rate * grad_start
+                relation_embeddings[relation_type_index] -= learning_rate * grad_relation
+                node_embeddings[end_node_index] -= learning_rate * grad_end
+                node_embeddings[corrupted_end_node_index] -= learning_rate * grad_corrupted_end
+
+        losses.append(total_loss)
+        print(f"Epoch {epoch + 1}/{epochs}, Loss: {total_loss:.4f}")
+
+    return losses
+
+def train_transe_batched(heads, relations, tails, node_embeddings, relation_embeddings, epochs=500, learning_rate=0.1, margin=1.0, batch_size=1024, rng=np.random):
+    """
+    Trains TransE embeddings in place with vectorized mini-batches.
+
+    Each batch computes its distances, hinge losses and gradients as array
+    operations and scatters the updates back with np.add.at, using the same
+    update rule as train_transe_per_triple. Updates to a node that occurs
+    several times in one batch are averaged so that hub nodes (genres,
+    prolific actors) do not take one oversized step per batch.
+
+    Args:
+        heads (np.ndarray): int32 array of head node indices.
+        relations (np.ndarray): int32 array of relation type indices.
+        tails (np.ndarray): int32 array of tail node indices.
+        node_embeddings (np.ndarray): Node embedding matrix, updated in place.
+        relation_embeddings (np.ndarray): Relation embedding matrix, updated in place.
+        epochs (int, optional): The number of training epochs.
+            Defaults to 500.
+        learning_rate (float, optional): The learning rate for the optimization.
+            Defaults to 0.1.
+        margin (float, optional): The margin used in the TransE loss function.
+            Defaults to 1.0.
+        batch_size (int, optional): The number of triples per mini-batch.
+            Defaults to 1024.
+        rng (np.random.RandomState, optional): Source of shuffles and negative
+            samples. Defaults to NumPy's global generator.
+
+    Returns:
+        list: The total loss of every epoch.
+    """
+    num_triples = len(heads)
+    num_nodes = len(node_embeddings)
+    losses = []
+
+    for epoch in range(epochs):
+        total_loss = 0.0
+        order = rng.permutation(num_triples)
+        for start in range(0, num_triples, batch_size):
+            batch = order[start:start + batch_size]
+            h, r, t = heads[batch], relations[batch], tails[batch]
+
+            # Generate corrupted tails for negative sampling, redrawing any that hit the true tail
+            corrupted = rng.randint(num_nodes, size=len(batch))
+            clash = corrupted == t
+            while clash.any():
+                corrupted[clash] = rng.randint(num_nodes, size=int(clash.sum()))
+                clash = corrupted == t
+
+            translation = node_embeddings[h] + relation_embeddings[r]
+            residual = translation - node_embeddings[t]
+            corrupted_residual = translation - node_embeddings[corrupted]
+            distance = np.linalg.norm(residual, axis=1)
+            corrupted_distance = np.linalg.norm(corrupted_residual, axis=1)
+
+            loss = np.maximum(0, margin + distance - corrupted_distance)
+            total_loss += loss.sum()
+
+            active = loss > 0
+            if not active.any():
+                continue
+            h, r, t, corrupted = h[active], r[active], t[active], corrupted[active]
+            grad = 2 * residual[active]
+            grad_corrupted = 2 * corrupted_residual[active]
+
+            # Only the rows in the batch change, so their gradients are summed into compact buffers
+            # and averaged over the number of times each row occurs in the batch
+            batch_nodes, node_index = np.unique(np.concatenate([h, t, corrupted]), return_inverse=True)
+            node_grad = np.zeros((len(batch_nodes), node_embeddings.shape[1]), dtype=node_embeddings.dtype)
+            np.add.at(node_grad, node_index, np.concatenate([grad, -grad, grad_corrupted]))
+            node_counts = np.bincount(node_index, minlength=len(batch_nodes))
+            node_embeddings[batch_nodes] -= learning_rate * node_grad / node_counts[:, None]
+
+            batch_relations, relation_index = np.unique(r, return_inverse=True)
+            relation_grad = np.zeros((len(batch_relations), relation_embeddings.shape[1]), dtype=relation_embeddings.dtype)
+            np.add.at(relation_grad, relation_index, grad)
+            relation_counts = np.bincount(relation_index, minlength=len(batch_relations))
+            relation_embeddings[batch_relations] -= learning_rate * relation_grad / relation_counts[:, None]
+
+        losses.append(total_loss)
+        print(f"Epoch {epoch + 1}/{epochs}, Loss: {total_loss:.4f}")
+
+    return losses
+
+
+class TransEModel:
+    """
+    TransE embedding model trained on a TripleStore.
+
+    Args:
+        embedding_dim (int, optional): The dimension of the node and relation embeddings.
+            Defaults to 100.
+        epochs (int, optional): The number of epochs run by fit.
+            Defaults to 500.
+        learning_rate (float, optional): The learning rate for the optimization.
+            Defaults to 0.1.
+        margin (float, optional): The margin used in the TransE loss function.
+            Defaults to 1.0.
+        batch_size (int, optional): Train with vectorized mini-batches of this
+            many triples. Defaults to None, which trains one triple at a time.
+        seed (int, optional): Seed for initialization and negative sampling.
+            Defaults to None.
+    """
+
+    def __init__(self, embedding_dim=100, epochs=500, learning_rate=0.1, margin=1.0, batch_size=None, seed=None):
+        self.embedding_dim = embedding_dim
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.margin = margin
+        self.batch_size = batch_size
+        self.seed = seed
+        self.rng = np.random.RandomState(seed)
+        self.node_embeddings = None
+        self.relation_embeddings = None
+        self.losses = []
+
+    def _initialize(self, triples):
+        self.node_embeddings = self.rng.rand(triples.num_nodes, self.embedding_dim)
+        self.relation_embeddings = self.rng.rand(triples.num_relations, self.embedding_dim)
+        self.losses = []
+
+    def fit(self, triples):
+        """
+        Initializes fresh embeddings and trains them for self.epochs epochs.
+
+        Args:
+            triples (TripleStore): The indexed triples to train on.
+
+        Returns:
+            TransEModel: The fitted model.
+        """
+        self._initialize(triples)
+        return self.partial_fit(triples, epochs=self.epochs)
+
+    def partial_fit(self, triples, epochs=1):
+        """
+        Continues training the current embeddings, initializing them on first use.
+
+        Args:
+            triples (TripleStore): The indexed triples to train on. Must use
+                the same node and relation indexing as earlier calls.
+            epochs (int, optional): The number of additional epochs.
+                Defaults to 1.
+
+        Returns:
+            TransEModel: The model.
+        """
+        if self.node_embeddings is None:
+            self._initialize(triples)
+        elif self.node_embeddings.shape[0] != triples.num_nodes or self.relation_embeddings.shape[0] != triples.num_relations:
+            raise ValueError("The triple store does not match the indexing the model was trained on.")
+
+        if self.batch_size is None:
+            losses = train_transe_per_triple(triples.heads, triples.relations, triples.tails,
+                                             self.node_embeddings, self.relation_embeddings, epochs=epochs,
+                                             learning_rate=self.learning_rate, margin=self.margin, rng=self.rng)
+        else:
+            losses = train_transe_batched(triples.heads, triples.relations, triples.tails,
+                                          self.node_embeddings, self.relation_embeddings, epochs=epochs,
+                                          learning_rate=self.learning_rate, margin=self.margin,
+                                          batch_size=self.batch_size, rng=self.rng)
+        self.losses.extend(losses)
+        return self
+
+    def score(self, h, r, t):
+        """
+        Returns the TransE distance ||h + r - t|| of one or many triples.
+
+        Args:
+            h (int or np.ndarray): Head node index or indices.
+            r (int or np.ndarray): Relation type index or indices.
+            t (int or np.ndarray): Tail node index or indices.
+
+        Returns:
+            float or np.ndarray: The distance; lower means more plausible.
+        """
+        if self.node_embeddings is None:
+            raise ValueError("The model has not been fitted yet.")
+        residual = self.node_embeddings[h] + self.relation_embeddings[r] - self.node_embeddings[t]
+        return np.linalg.norm(residual, axis=-1)
+
+    def save(self, path):
+        """Saves the embeddings and hyperparameters to a .npz file."""
+        if self.node_embeddings is None:
+            raise ValueError("The model has not been fitted yet.")
+        np.savez(path, node_embeddings=self.node_embeddings, relation_embeddings=self.relation_embeddings,
+                 losses=np.array(self.losses), embedding_dim=self.embedding_dim, epochs=self.epochs,
+                 learning_rate=self.learning_rate, margin=self.margin,
+                 batch_size=-1 if self.batch_size is None else self.batch_size,
+                 seed=-1 if self.seed is None else self.seed, **self._rng_state())
+
+    def _rng_state(self):
+        state = self.rng.get_state(legacy=False)
+        return {'rng_key': state['state']['key'], 'rng_pos': state['state']['pos'],
+                'rng_has_gauss': state['has_gauss'], 'rng_gauss': state['gauss']}
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model written by save, ready for score or partial_fit."""
+        with np.load(path) as data:
+            batch_size = int(data['batch_size'])
+            seed = int(data['seed'])
+            model = cls(embedding_dim=int(data['embedding_dim']), epochs=int(data['epochs']),
+                        learning_rate=float(data['learning_rate']), margin=float(data['margin']),
+                        batch_size=None if batch_size < 0 else batch_size, seed=None if seed < 0 else seed)
+            # Restore the generator so a resumed run continues the same random stream
+            model.rng.set_state({'bit_generator': 'MT19937',
+                                 'state': {'key': data['rng_key'], 'pos': int(data['rng_pos'])},
+                                 'has_gauss': int(data['rng_has_gauss']), 'gauss': float(data['rng_gauss'])})
+            model.node_embeddings = data['node_embeddings']
+            model.relation_embeddings = data['relation_embeddings']
+            model.losses = data['losses'].tolist()
+        return model
+
+
+def save_embeddings(triples, model, directory="embeddings"):
+    """
+    Writes the trained embeddings as a compact binary artifact.
+
+    Every node label gets one float32 .npy matrix with a row per node, scaled
+    to unit length so the recommender can search the memory-mapped matrix as
+    it is, and the relation types share a relations.npy matrix. A small
+    index.json maps each row back to its Neo4j elementId and name. Nodes
+    missing from nodes.json are left out, as they are from the CSV output.
+
+    Args:
+        triples (TripleStore): The indexed triples the model was trained on.
+        model (TransEModel): The fitted model.
+        directory (str, optional): Directory to write the artifact to.
+            Defaults to "embeddings".
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    rows_by_label = {}
+    for i, (known, label) in enumerate(zip(triples.node_known, triples.node_labels)):
+        if known:
+            rows_by_label.setdefault(label, []).append(i)
+
+    index = {"embedding_dim": int(model.node_embeddings.shape[1]), "normalized": True, "labels": {}}
+    for label, rows in rows_by_label.items():
+        file_name = re.sub(r'[^A-Za-z0-9_-]', '_', label) + '.npy'
+        np.save(os.path.join(directory, file_name), normalize_embeddings(model.node_embeddings[rows]))
+        index["labels"][label] = {
+            "file": file_name,
+            "ids": [triples.node_ids[i] for i in rows],
+            "names": [triples.node_names[i] for i in rows]
+        }
+
+    np.save(os.path.join(directory, 'relations.npy'), model.relation_embeddings.astype(np.float32))
+    index["relations"] = {"file": "relations.npy", "types": triples.relation_types}
+
+    with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+def load_embeddings(directory="embeddings"):
+    """
+    Opens an artifact written by save_embeddings without copying or parsing the matrices.
+
+    Args:
+        directory (str, optional): Directory holding the artifact.
+            Defaults to "embeddings".
+
+    Returns:
+        tuple: The parsed index.json, a dict of memory-mapped node embedding
+            matrices keyed by label, and the memory-mapped relation embeddings.
+    """
+    with open(os.path.join(directory, 'index.json'), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+
+    node_embeddings = {label: np.load(os.path.join(directory, entry["file"]), mmap_mode='r')
+                       for label, entry in index["labels"].items()}
+    relation_embeddings = np.load(os.path.join(directory, index["relations"]["file"]), mmap_mode='r')
+    return index, node_embeddings, relation_embeddings
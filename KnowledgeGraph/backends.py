@@ -0,0 +1,160 @@
+# Graph backends for recomendation_system
+
+from movierecord import split_names
+
+class GraphBackend:
+    """
+    What recomendation_system needs from the movie graph.
+
+    favourites(movies) returns {movie: (genres, actors, directors)} as
+    frozensets for every movie found, and candidates(...) returns the movies
+    sharing an actor or director with the favourites and, separately, up to
+    genre_limit movies of a favourite genre whose sentiment is in sentiments.
+    """
+
+    def movie_names(self):
+        raise NotImplementedError
+
+    def graph_version(self):
+        """Changes whenever the graph is loaded again; None for a graph that never changes."""
+        return None
+
+    def favourites(self, movies):
+        raise NotImplementedError
+
+    def candidates(self, actors, directors, genres, sentiments=('Best', 'Good'), genre_limit=10):
+        raise NotImplementedError
+
+
+class Neo4jBackend(GraphBackend):
+    """Answers every call with one parameterized query against a Neo4jConnection."""
+
+    movies_query = '''MATCH (movie:Movie)
+RETURN (movie.name)
+'''
+
+    # Written by recommendation.ingest after every LOAD CSV
+    version_query = '''MATCH (version:GraphVersion {name: 'graph'})
+RETURN version.version AS version
+'''
+
+    # Favourite genres, actors and directors of each selected movie, in one round-trip
+    favourites_query = '''
+UNWIND $movies AS title
+MATCH (movie:Movie {name: title})
+OPTIONAL MATCH (movie)-[:GENRE_IS]->(genre:Genre)
+OPTIONAL MATCH (actor:Actor)-[:ACTED_IN]->(movie)
+OPTIONAL MATCH (director:Director)-[:DIRECTED]->(movie)
+RETURN title,
+       collect(DISTINCT genre.name) AS genres,
+       collect(DISTINCT actor.name) AS actors,
+       collect(DISTINCT director.name) AS directors
+'''
+
+    # Candidate movies sharing an actor, director or genre with the favourites, in one round-trip
+    candidates_query = '''
+CALL {
+    UNWIND $actors AS name
+    MATCH (:Actor {name: name})-[:ACTED_IN]->(candidate:Movie)
+    RETURN candidate.name AS candidate
+    UNION
+    UNWIND $directors AS name
+    MATCH (:Director {name: name})-[:DIRECTED]->(candidate:Movie)
+    RETURN candidate.name AS candidate
+}
+WITH collect(DISTINCT candidate) AS by_actor_director
+CALL {
+    UNWIND $genres AS name
+    MATCH (:Genre {name: name})<-[:GENRE_IS]-(candidate:Movie)
+    WHERE candidate.sentiment IN $sentiments
+    RETURN collect(DISTINCT candidate.name)[..$genre_limit] AS by_genre
+}
+RETURN by_actor_director, by_genre
+'''
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def movie_names(self):
+        return [record[0] for record in self.conn.stream(self.movies_query)]
+
+    def graph_version(self):
+        result = self.conn.execute_read(self.version_query)
+        return result[0]['version'] if result else None
+
+    def favourites(self, movies):
+        result = self.conn.execute_read(self.favourites_query, {'movies': list(movies)})
+        if result is None:
+            return None
+        return {record['title']: (frozenset(record['genres']), frozenset(record['actors']), frozenset(record['directors'])) for record in result}
+
+    def candidates(self, actors, directors, genres, sentiments=('Best', 'Good'), genre_limit=10):
+        result = self.conn.execute_read(self.candidates_query, {'actors': list(actors), 'directors': list(directors), 'genres': list(genres),
+                                                                'sentiments': list(sentiments), 'genre_limit': genre_limit})
+        if not result:
+            return None
+        return result[0]['by_actor_director'], result[0]['by_genre']
+
+
+class InMemoryBackend(GraphBackend):
+    """
+    Holds the movie graph as adjacency dicts built from the sample_data.csv
+    DataFrame, following the same rules as the LOAD CSV ingestion: actors,
+    directors and genres are all split on ':', skipping empty and 'na' names.
+    """
+
+    def __init__(self, data):
+        import pandas as pd
+
+        self.movie_genres = {}
+        self.movie_actors = {}
+        self.movie_directors = {}
+        self.movie_sentiment = {}
+        self.actor_movies = {}
+        self.director_movies = {}
+        self.genre_movies = {}
+
+        for name, actors, director, genre, sentiment in zip(data['Name'], data['Actor'], data['Director'], data['Genre'], data['Sentiment']):
+            if pd.isna(name):continue
+            self.movie_genres.setdefault(name, set())
+            self.movie_actors.setdefault(name, set())
+            self.movie_directors.setdefault(name, set())
+            self.movie_sentiment[name] = sentiment
+
+            if not pd.isna(actors):
+                for actor in split_names(actors):
+                    self.movie_actors[name].add(actor)
+                    self.actor_movies.setdefault(actor, {})[name] = None
+            if not pd.isna(director):
+                for director_name in split_names(director):
+                    self.movie_directors[name].add(director_name)
+                    self.director_movies.setdefault(director_name, {})[name] = None
+            if not pd.isna(genre):
+                for genre_name in split_names(genre):
+                    self.movie_genres[name].add(genre_name)
+                    self.genre_movies.setdefault(genre_name, {})[name] = None
+
+    @classmethod
+    def from_csv(cls, path='sample_data.csv'):
+        import pandas as pd
+
+        return cls(pd.read_csv(path))
+
+    def movie_names(self):
+        return list(self.movie_sentiment)
+
+    def favourites(self, movies):
+        return {movie: (frozenset(self.movie_genres[movie]), frozenset(self.movie_actors[movie]), frozenset(self.movie_directors[movie]))
+                for movie in movies if movie in self.movie_sentiment}
+
+    def candidates(self, actors, directors, genres, sentiments=('Best', 'Good'), genre_limit=10):
+        by_actor_director = {}
+        for actor in actors:by_actor_director.update(self.actor_movies.get(actor, {}))
+        for director in directors:by_actor_director.update(self.director_movies.get(director, {}))
+
+        by_genre = {}
+        for genre in genres:
+            for movie in self.genre_movies.get(genre, {}):
+                if self.movie_sentiment[movie] in sentiments:by_genre[movie] = None
+
+        return list(by_actor_director), list(by_genre)[:genre_limit]
@@ -0,0 +1,102 @@
+# Resumable crawl frontier over the IMDb listing pages
+
+import json
+import os
+
+GENRES = ('action', 'adventure', 'animation', 'biography', 'comedy', 'crime', 'documentary', 'drama', 'family', 'fantasy',
+          'film-noir', 'game-show', 'history', 'horror', 'music', 'musical', 'mystery', 'news', 'reality-tv', 'romance',
+          'sci-fi', 'short', 'sport', 'talk-show', 'thriller', 'war', 'western')
+
+# (min, max) user rating of every band, best first
+RATING_BANDS = tuple((rating - 1, rating) for rating in range(10, 0, -1))
+
+class CrawlFrontier:
+    """
+    Every genre x rating band listing, walked page by page, with its progress
+    and the scraped titles appended to JSONL files in directory.
+
+    pages.jsonl has one line per finished listing page with the start of the
+    next page, or null once the listing is exhausted; records.jsonl has one
+    line per scraped title. Lines are only ever appended, so an interrupted
+    crawl loses at most the titles in flight. A crawl is a numbered pass over
+    every listing: an unfinished pass resumes where it stopped, and once a
+    pass is complete the next one starts over from the first pages, skipping
+    every title already in records.jsonl.
+    """
+
+    def __init__(self, directory='crawl', genres=GENRES, rating_bands=RATING_BANDS, page_size=50):
+        self.directory = directory
+        self.listings = [(genre, band) for genre in genres for band in rating_bands]
+        self.page_size = page_size
+        os.makedirs(directory, exist_ok=True)
+        self.pages_path = os.path.join(directory, 'pages.jsonl')
+        self.records_path = os.path.join(directory, 'records.jsonl')
+        for path in (self.pages_path, self.records_path):
+            self.end_last_line(path)
+
+        self.seen = {record['Id'] for record in self.records()}
+
+        self.crawl_pass = 0
+        self.progress = {}
+        for entry in self.read_lines(self.pages_path):
+            if entry['pass'] > self.crawl_pass:
+                self.crawl_pass, self.progress = entry['pass'], {}
+            self.progress[self.listing_key(*entry['listing'])] = entry['next']
+        if self.crawl_pass == 0 or self.pass_finished():
+            self.crawl_pass, self.progress = self.crawl_pass + 1, {}
+
+    @staticmethod
+    def read_lines(path):
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                # A crawl killed mid-write can leave a truncated last line
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    pass
+
+    @staticmethod
+    def end_last_line(path):
+        """Terminates a line left truncated by a killed crawl, so the next append starts on its own line."""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    @staticmethod
+    def listing_key(genre, band):
+        return (genre, tuple(band))
+
+    def pass_finished(self):
+        return all(self.progress.get(self.listing_key(*listing), 1) is None for listing in self.listings)
+
+    def listing_url(self, rooturl, genre, band, start=1):
+        return f'{rooturl}/search/title/?title_type=feature&genres={genre}&user_rating={band[0]},{band[1]}&start={start}'
+
+    def pending(self):
+        """Yields (genre, band, start) of the next page of every listing that is not exhausted in this pass."""
+        for genre, band in self.listings:
+            start = self.progress.get(self.listing_key(genre, band), 1)
+            if start is not None:
+                yield genre, band, start
+
+    def finish_page(self, genre, band, start, num_titles):
+        """Records a fully scraped page and returns the start of the next one, or None at the end of the listing."""
+        next_start = start + self.page_size if num_titles >= self.page_size else None
+        self.progress[self.listing_key(genre, band)] = next_start
+        with open(self.pages_path, 'a') as f:
+            f.write(json.dumps({'pass': self.crawl_pass, 'listing': [genre, list(band)], 'start': start, 'next': next_start}) + '\n')
+        return next_start
+
+    def add_record(self, record):
+        self.seen.add(record['Id'])
+        with open(self.records_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def records(self):
+        """Yields every scraped title record, oldest first."""
+        yield from self.read_lines(self.records_path)
@@ -0,0 +1,221 @@
+# Compact typed movie graph
+
+import json
+import os
+
+import numpy as np
+
+from movierecord import MISSING_NAMES
+
+LABELS = ('Movie', 'Actor', 'Director', 'Genre')
+
+# relation: (source label, target label), matching the LOAD CSV ingestion in recommendation.py
+RELATIONS = {
+    'ACTED_IN': ('Actor', 'Movie'),
+    'DIRECTED': ('Director', 'Movie'),
+    'GENRE_IS': ('Movie', 'Genre'),
+}
+
+def build_csr(sources, targets, num_sources):
+    """Returns (indptr, indices) listing the sorted targets of every source."""
+    order = np.lexsort((targets, sources))
+    indices = targets[order].astype(np.int32)
+    indptr = np.zeros(num_sources + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_sources), out=indptr[1:])
+    return indptr, indices
+
+class NameTable:
+    """
+    Sorted names kept as one concatenated UTF-8 buffer with int64 offsets, so
+    each name costs its own length plus 8 bytes whatever the longest name is.
+    Name i is buffer[offsets[i]:offsets[i + 1]], and a lookup is a binary
+    search over the buffer.
+    """
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_names(cls, names):
+        """Builds the table of the distinct names, sorted by their UTF-8 bytes."""
+        # Sorting str by code point gives the same order as sorting their UTF-8 encodings
+        encoded = [name.encode('utf-8') for name in sorted(set(names))]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def encoded(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i):
+        return self.encoded(i).decode('utf-8')
+
+    def find(self, name):
+        """Returns the position of name, or None when it is not in the table."""
+        key = name.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.encoded(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self.encoded(low) == key else None
+
+    def positions(self, names):
+        """Returns the int64 position of every name, all of which must be in the table."""
+        ids = {name: i for i, name in enumerate(self.tolist())}
+        return np.fromiter((ids[name] for name in names), dtype=np.int64, count=len(names))
+
+    def tolist(self):
+        data, offsets = self.buffer.tobytes(), self.offsets.tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes
+
+class GraphStore:
+    """
+    Movie graph with integer node ids per label and int32 CSR adjacency per relation.
+
+    Every label keeps its own interned NameTable of sorted UTF-8 names whose
+    positions are the node ids, so a movie and an actor with the same name
+    are different nodes and a name lookup is a binary search. For
+    each relation, csr holds the targets of every source node and csc the
+    sources of every target node, so both directions are a slice lookup.
+    """
+
+    def __init__(self, names, csr, csc):
+        self.names = names
+        self.csr = csr
+        self.csc = csc
+
+    @classmethod
+    def from_dataframe(cls, data):
+        """
+        Builds the graph from the sample_data.csv DataFrame. Actors, directors
+        and genres are split on ':', skipping empty and 'na' names, like the
+        LOAD CSV ingestion does.
+        """
+        data = data.dropna(subset=['Name'])
+
+        def split_column(column):
+            exploded = data[[column, 'Name']].dropna().assign(**{column: lambda d: d[column].astype(str).str.split(':')}).explode(column)
+            return exploded[~exploded[column].isin(MISSING_NAMES)]
+
+        acted_in, directed, genre_is = split_column('Actor'), split_column('Director'), split_column('Genre')
+        edges = {
+            'ACTED_IN': (acted_in['Actor'].astype(str).tolist(), acted_in['Name'].astype(str).tolist()),
+            'DIRECTED': (directed['Director'].astype(str).tolist(), directed['Name'].astype(str).tolist()),
+            'GENRE_IS': (genre_is['Name'].astype(str).tolist(), genre_is['Genre'].astype(str).tolist()),
+        }
+
+        # Intern every label's names: the sorted unique names, with ids given by position
+        occurrences = {label: set() for label in LABELS}
+        occurrences['Movie'].update(data['Name'].astype(str))
+        for relation, (source_label, target_label) in RELATIONS.items():
+            occurrences[source_label].update(edges[relation][0])
+            occurrences[target_label].update(edges[relation][1])
+        names = {label: NameTable.from_names(occurrences.pop(label)) for label in LABELS}
+
+        csr, csc = {}, {}
+        for relation, (source_label, target_label) in RELATIONS.items():
+            num_sources, num_targets = len(names[source_label]), len(names[target_label])
+            sources = names[source_label].positions(edges[relation][0])
+            targets = names[target_label].positions(edges[relation][1])
+
+            # Repeated rows would otherwise add the same edge twice
+            unique = np.unique(sources * max(num_targets, 1) + targets)
+            sources, targets = unique // max(num_targets, 1), unique % max(num_targets, 1)
+
+            csr[relation] = build_csr(sources, targets, num_sources)
+            csc[relation] = build_csr(targets, sources, num_targets)
+
+        return cls(names, csr, csc)
+
+    def num_nodes(self, label):
+        return len(self.names[label])
+
+    def num_edges(self, relation):
+        return len(self.csr[relation][1])
+
+    def node_id(self, label, name):
+        return self.names[label].find(name)
+
+    def node_name(self, label, node):
+        return self.names[label][node]
+
+    def neighbours(self, relation, node, reverse=False):
+        """
+        Returns the int32 ids adjacent to a node through relation.
+
+        Args:
+            relation (str): ACTED_IN, DIRECTED or GENRE_IS.
+            node (int): Id of a node of the relation's source label, or of
+                its target label when reverse is True.
+            reverse (bool, optional): Follow the relation backwards.
+                Defaults to False.
+        """
+        indptr, indices = (self.csc if reverse else self.csr)[relation]
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def neighbour_names(self, relation, name, reverse=False):
+        """Looks a node up by name and returns the names of its neighbours through relation."""
+        source_label, target_label = RELATIONS[relation]
+        if reverse:source_label, target_label = target_label, source_label
+        node = self.node_id(source_label, name)
+        if node is None:
+            return []
+        return [self.node_name(target_label, i) for i in self.neighbours(relation, node, reverse)]
+
+    def nbytes(self):
+        """Size of the name tables and adjacency arrays in bytes."""
+        return (sum(names.nbytes for names in self.names.values())
+                + sum(indptr.nbytes + indices.nbytes for adjacency in (self.csr, self.csc) for indptr, indices in adjacency.values()))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for label in LABELS:
+            np.save(os.path.join(directory, f'{label}_names.npy'), self.names[label].buffer)
+            np.save(os.path.join(directory, f'{label}_name_offsets.npy'), self.names[label].offsets)
+        for relation in RELATIONS:
+            for direction, adjacency in (('csr', self.csr), ('csc', self.csc)):
+                np.save(os.path.join(directory, f'{relation}_{direction}_indptr.npy'), adjacency[relation][0])
+                np.save(os.path.join(directory, f'{relation}_{direction}_indices.npy'), adjacency[relation][1])
+        with open(os.path.join(directory, 'graph.json'), 'w') as f:
+            json.dump({'labels': list(LABELS), 'relations': RELATIONS}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        names = {label: NameTable(np.load(os.path.join(directory, f'{label}_names.npy'), mmap_mode=mmap_mode),
+                                  np.load(os.path.join(directory, f'{label}_name_offsets.npy'), mmap_mode=mmap_mode)) for label in LABELS}
+        csr, csc = {}, {}
+        for relation in RELATIONS:
+            for direction, adjacency in (('csr', csr), ('csc', csc)):
+                adjacency[relation] = (np.load(os.path.join(directory, f'{relation}_{direction}_indptr.npy'), mmap_mode=mmap_mode),
+                                       np.load(os.path.join(directory, f'{relation}_{direction}_indices.npy'), mmap_mode=mmap_mode))
+        return cls(names, csr, csc)
+
+    def to_networkx(self):
+        """
+        Exports a networkx.DiGraph for code that still expects one. Nodes are
+        keyed by (label, name) and carry label and name attributes; edges carry
+        their relation type.
+        """
+        import networkx as nx
+
+        G = nx.DiGraph()
+        names = {label: self.names[label].tolist() for label in LABELS}
+        for label in LABELS:
+            G.add_nodes_from(((label, name), {'label': label, 'name': name}) for name in names[label])
+        for relation, (source_label, target_label) in RELATIONS.items():
+            indptr, indices = self.csr[relation]
+            sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            G.add_edges_from(((source_label, names[source_label][s]), (target_label, names[target_label][t]), {'relation': relation})
+                             for s, t in zip(sources, indices))
+        return G
@@ -0,0 +1,155 @@
+# On-disk HTTP response cache for the scraper
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+class CacheMiss(Exception):
+    """Raised in replay-only mode for a URL that was never downloaded."""
+
+
+class CachedResponse:
+    def __init__(self, url, body_hash, status, etag, last_modified, fetched_at, body):
+        self.url = url
+        self.body_hash = body_hash
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.body = body
+
+
+class ResponseCache:
+    """
+    Content-addressed store of downloaded pages in one SQLite file.
+
+    Bodies are zlib-compressed and stored once per SHA-256 of their content.
+    Every successful download of a URL is recorded as a snapshot pointing at
+    its body, and the newest snapshot is the one served. Old snapshots are kept, so
+    pages can be parsed again after IMDb changes its markup.
+
+    Args:
+        path (str, optional): The SQLite file. Defaults to "http_cache.sqlite".
+        replay_only (bool, optional): Serve only what is already cached and
+            raise CacheMiss for anything else, without touching the network.
+            Defaults to False.
+        max_age (float, optional): Serve a snapshot younger than this many
+            seconds without revalidating it. Defaults to None, which
+            revalidates every snapshot with If-None-Match/If-Modified-Since.
+    """
+
+    def __init__(self, path='http_cache.sqlite', replay_only=False, max_age=None):
+        self.path = path
+        self.replay_only = replay_only
+        self.max_age = max_age
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript('''
+CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS snapshots (
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    hash TEXT NOT NULL REFERENCES bodies(hash),
+    status INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_url ON snapshots (url, fetched_at);
+''')
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, url):
+        """
+        Returns the newest successful (2xx) CachedResponse for url, or None.
+        Snapshots with another status, such as block pages kept by older
+        versions, never hide a good one.
+        """
+        with self.lock:
+            row = self.db.execute('''SELECT s.url, s.hash, s.status, s.etag, s.last_modified, s.fetched_at, b.body
+                                     FROM snapshots s JOIN bodies b ON b.hash = s.hash
+                                     WHERE s.url = ? AND s.status BETWEEN 200 AND 299 ORDER BY s.fetched_at DESC LIMIT 1''', (url,)).fetchone()
+        if row is None:
+            return None
+        return CachedResponse(*row[:6], zlib.decompress(row[6]))
+
+    def snapshots(self, url):
+        """Returns [(fetched_at, hash, status)] for every download of url, oldest first."""
+        with self.lock:
+            return self.db.execute('SELECT fetched_at, hash, status FROM snapshots WHERE url = ? ORDER BY fetched_at', (url,)).fetchall()
+
+    def body(self, body_hash):
+        with self.lock:
+            row = self.db.execute('SELECT body FROM bodies WHERE hash = ?', (body_hash,)).fetchone()
+        return None if row is None else zlib.decompress(row[0])
+
+    def is_fresh(self, entry):
+        return self.max_age is not None and time.time() - entry.fetched_at < self.max_age
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def store(self, url, status, headers, body):
+        """Records a downloaded response and returns its CachedResponse."""
+        body_hash = hashlib.sha256(body).hexdigest()
+        fetched_at = time.time()
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        with self.lock, self.db:
+            self.db.execute('INSERT OR IGNORE INTO bodies (hash, body) VALUES (?, ?)', (body_hash, zlib.compress(body, 6)))
+            self.db.execute('INSERT INTO snapshots (url, fetched_at, hash, status, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?)',
+                            (url, fetched_at, body_hash, status, etag, last_modified))
+        return CachedResponse(url, body_hash, status, etag, last_modified, fetched_at, body)
+
+    def touch(self, entry):
+        """Marks a snapshot as confirmed current by a 304 Not Modified."""
+        entry.fetched_at = time.time()
+        with self.lock, self.db:
+            self.db.execute('UPDATE snapshots SET fetched_at = ? WHERE url = ? AND hash = ?', (entry.fetched_at, entry.url, entry.body_hash))
+        return entry
+
+    def stats(self):
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+    def cached(self, url):
+        """
+        Returns (entry, headers) before a request: entry is a CachedResponse to
+        serve as-is, or None with the conditional headers to send.
+        """
+        entry = self.lookup(url)
+        if entry is not None and (self.replay_only or self.is_fresh(entry)):
+            self.hits += 1
+            return entry, None
+        if entry is None and self.replay_only:
+            raise CacheMiss(url)
+        return None, ({} if entry is None else self.conditional_headers(entry))
+
+    def update(self, url, status, headers, body):
+        """Returns the body to use after a request: the cached one on 304, the new one otherwise."""
+        if status == 304:
+            entry = self.lookup(url)
+            if entry is not None:
+                self.revalidated += 1
+                return self.touch(entry).body
+        self.misses += 1
+        # Anything but a success, such as a 404, a 429 rate limit or a 403 captcha page, is passed
+        # through but not kept, so it never replaces a good snapshot and the next run retries it
+        if not 200 <= status < 300:
+            return body
+        return self.store(url, status, headers, body).body
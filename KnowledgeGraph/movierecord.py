@@ -0,0 +1,75 @@
+# One scraped movie, and batched writers for streams of them
+
+from dataclasses import dataclass, field
+from itertools import islice
+
+# Column of every MovieRecord field in the scraped CSV, in the order of sample_data.csv
+COLUMNS = {'id': 'Id', 'name': 'Name', 'year': 'Year', 'duration': 'Duration', 'rated': 'Rated', 'actor': 'Actor',
+           'director': 'Director', 'rating': 'Rating', 'genre': 'Genre', 'comments': 'Comments'}
+
+@dataclass(slots=True)
+class MovieRecord:
+    id: str
+    name: str
+    year: str = 'na'
+    duration: str = 'na'
+    rated: str = 'na'
+    actor: str = ''
+    director: str = ''
+    rating: str = 'na'
+    genre: str = ''
+    comments: list = field(default_factory=list)
+
+    def to_row(self):
+        return {column: getattr(self, name) for name, column in COLUMNS.items()}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(**{name: row[column] for name, column in COLUMNS.items() if column in row})
+
+# What an Actor, Director or Genre cell holds when the title has none; scrapes before empty cells wrote 'na'
+MISSING_NAMES = ('', 'na')
+
+def split_names(value):
+    """The names in an Actor, Director or Genre cell, which are joined with ':', without the missing ones."""
+    return [name for name in str(value).split(':') if name not in MISSING_NAMES]
+
+def batches(records, batch_size):
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+def write_records(records, path, batch_size=1000):
+    """
+    Writes a stream of MovieRecords to a CSV file, or a Parquet file when path
+    ends in .parquet, holding at most batch_size records in memory at a time.
+
+    Returns:
+        int: The number of records written.
+    """
+    if path.endswith('.parquet'):
+        return write_parquet(records, path, batch_size)
+    # Imported here so that importing this module stays cheap
+    import pandas as pd
+
+    written = 0
+    for batch in batches(records, batch_size):
+        pd.DataFrame([record.to_row() for record in batch], columns=list(COLUMNS.values())).to_csv(
+            path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += len(batch)
+    if written == 0:
+        pd.DataFrame(columns=list(COLUMNS.values())).to_csv(path, index=False)
+    return written
+
+def write_parquet(records, path, batch_size=1000):
+    # pyarrow is only needed for Parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.list_(pa.string()) if name == 'comments' else pa.string()) for name, column in COLUMNS.items()])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches(records, batch_size):
+            writer.write_table(pa.Table.from_pylist([record.to_row() for record in batch], schema=schema))
+            written += len(batch)
+    return written
@@ -1,55 +1,66 @@
 # NLP
 
-from bs4 import BeautifulSoup
-import requests
-import pandas as pd
+import ast
 import os
-from IPython.display import FileLink
-import re
-import time
-from os import replace
 # from neo4j import GraphDatabase
 
-from scrapping import comments_list
+from sentiment import SentimentCache, sentiment_stage
 
-nlp_score=[]
-sentiment_list=[]
+def read_scraped(path):
+  """
+  Reads the records written by the scrape stage: a .csv or .parquet file, or
+  the crawl directory itself. Comments come back as lists.
+  """
+  import pandas as pd
 
-from textblob import TextBlob
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+  if os.path.isdir(path):
+    from frontier import CrawlFrontier
+    return pd.DataFrame(list(CrawlFrontier(path).records()))
+  if path.endswith('.parquet'):
+    data=pd.read_parquet(path)
+    data['Comments']=data['Comments'].map(list)
+    return data
+  data=pd.read_csv(path)
+  # The CSV writer stores each list of comments as its repr
+  data['Comments']=data['Comments'].map(lambda comments:ast.literal_eval(comments) if isinstance(comments,str) else [])
+  return data
 
-for movie in comments_list:
-  nlp=0
+def main(input='scraped_data.csv',output='sentiment_data.csv',scorer='textblob',processes=None,cache_path='sentiment_cache.sqlite'):
+  """
+  Sentiment stage: scores the comments of every scraped movie and writes the
+  records with their "NLP Score" and "Sentiment" columns added.
 
-  vgood=0
-  good=0
-  bad=0
-  vbad=0
+  Args:
+    input (str, optional): The scraped records, see read_scraped. Defaults to "scraped_data.csv".
+    output (str, optional): The CSV file to write. Defaults to "sentiment_data.csv".
+    scorer (str, optional): "textblob" or "vader". Defaults to "textblob".
+    processes (int, optional): The number of worker processes. Defaults to None, this process.
+    cache_path (str, optional): The SentimentCache file, or None to disable it.
+      Defaults to "sentiment_cache.sqlite".
 
-  for comment in movie[:20]:
-    blob=TextBlob(comment)
-    score=blob.sentiment.polarity
+  Returns:
+    pd.DataFrame: The records written.
+  """
+  data=read_scraped(input)
+  cache=SentimentCache(cache_path) if cache_path else None
+  try:
+    movie_ids,nlp_scores,counts,labels=sentiment_stage(enumerate(data['Comments']),scorer=scorer,processes=processes,cache=cache)
+  finally:
+    if cache!=None:cache.close()
+  if cache!=None:
+    stats=cache.stats()
+    print(f"Sentiment cache: {stats['hits']} hits, {stats['misses']} misses, {stats['hit_rate']:.1%} hit rate")
 
-    nlp+=score
+  data['NLP Score']=nlp_scores
+  data['Sentiment']=labels
+  data.to_csv(output,index=False)
+  print(f'Wrote {len(data)} records to {output}')
+  return data
 
-    if score>0:
-      if score>0.5:vgood+=1
-      else:good+=1
-    elif score<0:
-      if score<-0.5:vbad+=1
-      else:bad+=1
 
-  if len(movie)==0:divide=1
-  else:divide=len(movie)
-
-  nlp_score.append(nlp/divide)
-
-  sentiment=(vbad,bad,good,vgood)
-  if max(sentiment)==0:
-    sentiment_list.append('Neutral')
-  else:
-    max_sentiment=max(sentiment)
-    if max_sentiment==vgood:sentiment_list.append('Best')
-    elif max_sentiment==good:sentiment_list.append('Good')
-    elif max_sentiment==bad:sentiment_list.append('Bad')
-    else:sentiment_list.append('Worst')
+if __name__=='__main__':
+  # KG_SCORER picks textblob or vader; KG_PROCESSES sets the worker processes (1 scores in this process).
+  # Scores are kept in KG_SENTIMENT_CACHE (empty to disable), so later runs only score new text
+  main(input=os.environ.get('KG_INPUT','scraped_data.csv'),output=os.environ.get('KG_OUTPUT','sentiment_data.csv'),
+       scorer=os.environ.get('KG_SCORER','textblob'),processes=int(os.environ.get('KG_PROCESSES',os.cpu_count() or 1)),
+       cache_path=os.environ.get('KG_SENTIMENT_CACHE','sentiment_cache.sqlite'))
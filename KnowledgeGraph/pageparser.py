@@ -0,0 +1,257 @@
+# Fast, declarative parsing of the scraped IMDb pages
+
+import json
+import re
+import sys
+import time
+from html import unescape
+
+from lxml import etree, html
+
+# kind of page: {field: (tag, classes, first)}. An element matches when it has
+# every listed class; first keeps only the first match in document order,
+# otherwise every match is returned
+SELECTORS = {
+    'listing': {
+        'title': ('a', 'ipc-title-link-wrapper', False),
+        'metadata': ('span', 'dli-title-metadata-item', False),
+    },
+    'title': {
+        'actor': ('a', 'sc-bfec09a1-1 gCQkeh', True),
+        'director': ('a', 'ipc-metadata-list-item__list-content-item ipc-metadata-list-item__list-content-item--link', True),
+        'rating': ('span', 'sc-eb51e184-1 cxhhrI', True),
+        'genre': ('span', 'ipc-chip__text', True),
+    },
+    'reviews': {
+        'comments': ('a', 'title', False),
+    },
+}
+
+def class_xpath(tag, classes):
+    tests = ''.join(f"[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]" for name in classes.split())
+    return f'//{tag}{tests}'
+
+def element_text(element):
+    """Same text as BeautifulSoup's get_text(strip=True)."""
+    return ''.join(text.strip() for text in element.itertext())
+
+class PageParser:
+    """
+    Evaluates SELECTORS with lxml and precompiled XPath, which is several
+    times faster than building a BeautifulSoup tree and scanning it with
+    find/find_all.
+    """
+
+    def __init__(self, selectors=SELECTORS):
+        self.selectors = selectors
+        self.xpaths = {kind: {field: etree.XPath(class_xpath(tag, classes)) for field, (tag, classes, first) in fields.items()}
+                       for kind, fields in selectors.items()}
+        # Every field of a kind at once, in document order
+        self.unions = {kind: etree.XPath(' | '.join(class_xpath(tag, classes) for tag, classes, first in fields.values()))
+                       for kind, fields in selectors.items()}
+
+    @staticmethod
+    def tree(page):
+        try:
+            return html.fromstring(page)
+        except (etree.ParserError, ValueError):
+            return None
+
+    def elements(self, page, kind):
+        """Returns {field: element or None} for first fields and {field: [elements]} for the others."""
+        tree = self.tree(page)
+        found = {}
+        for field, (tag, classes, first) in self.selectors[kind].items():
+            matches = [] if tree is None else self.xpaths[kind][field](tree)
+            found[field] = (matches[0] if matches else None) if first else matches
+        return found
+
+    def parse(self, page, kind):
+        """Same as elements, with the text of every element instead."""
+        parsed = {}
+        for field, found in self.elements(page, kind).items():
+            if isinstance(found, list):
+                parsed[field] = [element_text(element) for element in found]
+            else:
+                parsed[field] = None if found is None else element_text(found)
+        return parsed
+
+    def in_order(self, page, kind):
+        """Yields (field, element) for every match of every field of kind, in document order."""
+        tree = self.tree(page)
+        if tree is None:
+            return
+        fields = {element: field for field, xpath in self.xpaths[kind].items() for element in xpath(tree)}
+        for element in self.unions[kind](tree):
+            yield fields[element], element
+
+def parse_with_soup(page, kind, selectors=SELECTORS):
+    """PageParser.parse on a full BeautifulSoup tree, the way the scraper used to parse; kept as the benchmark baseline."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, "html.parser")
+    parsed = {}
+    for field, (tag, classes, first) in selectors[kind].items():
+        matches = soup.find_all(tag, class_=lambda value, classes=classes.split(): value is not None and all(name in value.split() for name in classes))
+        texts = [match.get_text(strip=True) for match in matches]
+        parsed[field] = (texts[0] if texts else None) if first else texts
+    return parsed
+
+PARSER = PageParser()
+
+def parse_listing(page, parser=PARSER):
+    """
+    Yields (href, name, year, duration, rated) for every title of a listing page.
+
+    The metadata spans that follow a title link in document order belong to
+    that title, and each one is recognised by its text rather than its
+    position, so a title missing any of them just gets 'na' for it.
+    """
+    entry = None
+    for field, element in parser.in_order(page, 'listing'):
+        text = element_text(element)
+        if field == 'title':
+            if entry is not None:
+                yield tuple(entry)
+            if re.match(r'\d+\. ', text):
+                text = text[text.index('.') + 2:]
+            entry = [element.get('href'), text, 'na', 'na', 'na']
+        elif entry is not None:
+            if len(text) == 4 and text.isnumeric():
+                entry[2] = text
+            elif text and re.fullmatch(r'(\d+h)? ?(\d+m)?', text):
+                entry[3] = text
+            elif text:
+                entry[4] = text
+    if entry is not None:
+        yield tuple(entry)
+
+LD_JSON = re.compile(rb'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+
+def parse_ld_json(page):
+    """
+    Returns the schema.org Movie object of the page's application/ld+json
+    block, found with one regex search instead of a parse of the whole page,
+    or None when there is none.
+    """
+    for match in LD_JSON.finditer(page):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else data.get('@graph', [data])
+        for item in items:
+            if isinstance(item, dict) and item.get('name') and ('actor' in item or 'genre' in item or 'director' in item):
+                return item
+    return None
+
+def ld_names(value):
+    """Names of a schema.org Person, a list of them, or plain strings; IMDb HTML-escapes them."""
+    if value is None:
+        return []
+    names = []
+    for item in value if isinstance(value, list) else [value]:
+        name = item.get('name') if isinstance(item, dict) else item
+        if name:
+            names.append(unescape(str(name)))
+    return names
+
+def iso_duration(value):
+    """Formats an ISO 8601 duration such as PT2H22M like the listing pages do (2h 22m)."""
+    match = re.fullmatch(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:\d+S)?', value or '')
+    if match is None or not any(match.groups()):
+        return None
+    return ' '.join(f'{int(number)}{unit}' for number, unit in zip(match.groups(), 'hm') if number)
+
+def parse_title_page(page, parser=PARSER):
+    """
+    Returns the fields of a title page as a dict with the lists "actors",
+    "directors" and "genres" and the strings "rating", "year", "duration" and
+    "rated", which are None when missing.
+
+    Every field comes from the page's JSON-LD block when it has it; the CSS
+    selectors, which only see the first actor and genre, are used only for the
+    fields the block lacks, or for the whole page when there is no block.
+    Raises ValueError when neither finds any actor, director or genre.
+    """
+    fields = {'actors': [], 'directors': [], 'genres': [], 'rating': None, 'year': None, 'duration': None, 'rated': None}
+    movie = parse_ld_json(page)
+    if movie is not None:
+        fields['actors'] = ld_names(movie.get('actor'))
+        fields['directors'] = ld_names(movie.get('director'))
+        fields['genres'] = ld_names(movie.get('genre'))
+        rating = (movie.get('aggregateRating') or {}).get('ratingValue')
+        fields['rating'] = None if rating is None else str(rating)
+        fields['year'] = (movie.get('datePublished') or '')[:4] or None
+        fields['duration'] = iso_duration(movie.get('duration'))
+        fields['rated'] = movie.get('contentRating')
+
+    if not (fields['actors'] and fields['directors'] and fields['genres']):
+        css = parser.parse(page, 'title')
+        for field, key in (('actors', 'actor'), ('directors', 'director'), ('genres', 'genre')):
+            if not fields[field] and css[key]:
+                fields[field] = [css[key]]
+        if fields['rating'] is None:
+            fields['rating'] = css['rating']
+
+    if not (fields['actors'] or fields['directors'] or fields['genres']):
+        raise ValueError('No actor, director or genre found on the title page')
+    return fields
+
+def parse_reviews_page(page, parser=PARSER):
+    return parser.parse(page, 'reviews')['comments']
+
+def page_kind(url):
+    if '/search/' in url:
+        return 'listing'
+    if '/reviews' in url:
+        return 'reviews'
+    return 'title'
+
+def benchmark(pages, repeat=3, parser=PARSER):
+    """
+    Times parse_with_soup against parser.parse on every (kind, page) and
+    checks that both give the same fields.
+
+    Returns:
+        dict: {kind: (pages, soup seconds per page, lxml seconds per page)}.
+    """
+    results = {}
+    for kind in SELECTORS:
+        bodies = [page for kind_of_page, page in pages if kind_of_page == kind]
+        if not bodies:
+            continue
+        for page in bodies:
+            if parse_with_soup(page, kind) != parser.parse(page, kind):
+                print(f'Warning: the lxml and BeautifulSoup parses of a {kind} page differ')
+                break
+
+        timings = []
+        for parse in (parse_with_soup, parser.parse):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for page in bodies:
+                    parse(page, kind)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best / len(bodies))
+        results[kind] = (len(bodies), *timings)
+        print(f'{kind}: {len(bodies)} pages, BeautifulSoup {timings[0] * 1000:.2f} ms/page, lxml {timings[1] * 1000:.2f} ms/page, '
+              f'{timings[0] / timings[1]:.1f}x faster')
+    return results
+
+if __name__ == '__main__':
+    # Benchmarks on the pages saved by a crawl: python pageparser.py [http_cache.sqlite] [max pages per kind]
+    from httpcache import ResponseCache
+
+    path = sys.argv[1] if len(sys.argv) > 1 else 'http_cache.sqlite'
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with ResponseCache(path, replay_only=True) as cache:
+        urls = [row[0] for row in cache.db.execute('SELECT DISTINCT url FROM snapshots')]
+        pages, counts = [], {}
+        for url in urls:
+            kind = page_kind(url)
+            if counts.get(kind, 0) < limit:
+                counts[kind] = counts.get(kind, 0) + 1
+                pages.append((kind, cache.lookup(url).body))
+    benchmark(pages)
@@ -2,30 +2,59 @@
 
 # Neo4j
 
-from neo4j import GraphDatabase
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from backends import InMemoryBackend, Neo4jBackend
 
 class Neo4jConnection:
+    """
+    Wraps one Neo4j driver, and so one connection pool, to be shared by all requests.
+
+    Sessions are cheap and borrow a pooled connection, so every call opens a
+    short-lived session while the connections themselves are reused. Use it
+    as a context manager, or call close(), to release the pool.
+    """
 
-    def __init__(self, uri, user, pwd):
+    def __init__(self, uri, user, pwd, max_connection_pool_size=50, connection_acquisition_timeout=60.0, max_transaction_retry_time=15.0):
         self.__uri = uri
         self.__user = user
         self.__pwd = pwd
         self.__driver = None
+        # Only the Neo4j backend needs the driver, so KG_BACKEND=memory runs without it
+        from neo4j import GraphDatabase
+
         try:
-            self.__driver = GraphDatabase.driver(self.__uri, auth=(self.__user, self.__pwd))
+            self.__driver = GraphDatabase.driver(self.__uri, auth=(self.__user, self.__pwd),
+                                                 max_connection_pool_size=max_connection_pool_size,
+                                                 connection_acquisition_timeout=connection_acquisition_timeout,
+                                                 max_transaction_retry_time=max_transaction_retry_time)
         except Exception as e:
             print("Failed to create the driver:", e)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def close(self):
         if self.__driver is not None:
             self.__driver.close()
+            self.__driver = None
+
+    def __session(self, db=None, **config):
+        return self.__driver.session(database=db, **config) if db is not None else self.__driver.session(**config)
 
     def query(self, query, parameters=None, db=None):
         assert self.__driver is not None, "Driver not initialized!"
         session = None
         response = None
         try:
-            session = self.__driver.session(database=db) if db is not None else self.__driver.session()
+            session = self.__session(db)
             response = list(session.run(query, parameters))
         except Exception as e:
             print("Query failed:", e)
@@ -34,43 +63,165 @@ class Neo4jConnection:
                 session.close()
         return response
 
-conn = Neo4jConnection(uri="bolt://54.162.95.224:7687", user="neo4j", pwd="thickness-receptacles-evacuation")
+    def execute_read(self, query, parameters=None, db=None):
+        """Runs a read query in a managed transaction, retried by the driver on transient errors."""
+        assert self.__driver is not None, "Driver not initialized!"
+        response = None
+        try:
+            with self.__session(db) as session:
+                response = session.execute_read(lambda tx: list(tx.run(query, parameters)))
+        except Exception as e:
+            print("Query failed:", e)
+        return response
 
-query='''LOAD CSV WITH HEADERS FROM 'https://docs.google.com/spreadsheets/d/e/2PACX-1vQyzVEQHwAfxmFrUoMTTZlZKeQOF8wEtTG2cu6jG-cuhO0z0I5vLkAdpljAQQVQBQwYWKd3MJDUcW1I/pub?gid=2024569982&single=true&output=csv' AS row
+    def stream(self, query, parameters=None, db=None, fetch_size=1000):
+        """Yields records as they arrive, fetching fetch_size at a time, instead of holding the whole result."""
+        assert self.__driver is not None, "Driver not initialized!"
+        with self.__session(db, fetch_size=fetch_size) as session:
+            yield from session.run(query, parameters)
+
+class RecommendationCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    hits and misses count lookups since the cache was created.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic(), value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.__entries)}
+
+# Favourite genres/actors/directors per movie, and full results per set of selected movies
+favourites_cache = RecommendationCache(maxsize=4096)
+recommendations_cache = RecommendationCache(maxsize=1024)
+
+def invalidate_caches():
+    favourites_cache.clear()
+    recommendations_cache.clear()
+
+def cache_stats():
+    return {'favourites': favourites_cache.stats(), 'recommendations': recommendations_cache.stats()}
+
+# Ingestion usually runs in another process than the server, so the server asks the
+# graph for its version at most every KG_VERSION_CHECK_INTERVAL seconds
+VERSION_CHECK_INTERVAL = float(os.environ.get('KG_VERSION_CHECK_INTERVAL', 30))
+graph_versions = {}
+version_lock = threading.Lock()
+
+def check_graph_version(backend):
+    """Clears the caches when the graph was ingested again since the last check, by any process."""
+    now = time.monotonic()
+    with version_lock:
+        checked = graph_versions.get(backend)
+        if checked is not None and now - checked[0] < VERSION_CHECK_INTERVAL:
+            return
+    version = backend.graph_version()
+    with version_lock:
+        checked = graph_versions.get(backend)
+        if checked is not None and checked[1] != version:
+            invalidate_caches()
+        graph_versions[backend] = (now, version)
+
+
+# The published sheet of sample_data.csv, loaded by default
+SAMPLE_DATA_URL = 'https://docs.google.com/spreadsheets/d/e/2PACX-1vQyzVEQHwAfxmFrUoMTTZlZKeQOF8wEtTG2cu6jG-cuhO0z0I5vLkAdpljAQQVQBQwYWKd3MJDUcW1I/pub?gid=2024569982&single=true&output=csv'
+
+query='''LOAD CSV WITH HEADERS FROM $url AS row
 
 // Create or merge the movie nodes
 MERGE (m:Movie {name: row.Name, year: row.Year, rated: row.Rated, duration: row.Duration, rating:row.Rating, sentiment:row.Sentiment})
 
-// Create or merge the actor nodes and relationships
-WITH row, m
-UNWIND split(row.Actor, ':') AS actorName
-MERGE (a:Actor {name: actorName})
-MERGE (a)-[:ACTED_IN]->(m)
-
-// Create or merge the director nodes and relationships
-WITH row, m
-MERGE (d:Director {name: row.Director})
-MERGE (d)-[:DIRECTED]->(m)
-
-// Create or merge the genre nodes and relationships
-WITH row, m
-MERGE (g:Genre {name: row.Genre})
-MERGE (m)-[:GENRE_IS]->(g)
-'''
+// Create or merge the actor, director and genre nodes and relationships. Empty and 'na' names are
+// skipped, and FOREACH keeps the row even when a column has no names
+FOREACH (actorName IN [name IN split(coalesce(row.Actor, ''), ':') WHERE NOT name IN ['', 'na']] |
+  MERGE (a:Actor {name: actorName})
+  MERGE (a)-[:ACTED_IN]->(m))
 
-res=conn.query(query)
+FOREACH (directorName IN [name IN split(coalesce(row.Director, ''), ':') WHERE NOT name IN ['', 'na']] |
+  MERGE (d:Director {name: directorName})
+  MERGE (d)-[:DIRECTED]->(m))
 
-query_string = '''MATCH (movie:Movie)
-RETURN (movie.name)
+FOREACH (genreName IN [name IN split(coalesce(row.Genre, ''), ':') WHERE NOT name IN ['', 'na']] |
+  MERGE (g:Genre {name: genreName})
+  MERGE (m)-[:GENRE_IS]->(g))
 '''
-movies = conn.query(query_string)
 
-name_html=''
-for record in movies:
-  temp='\n\t\t\t\t\t<option value="'+record[0]+'">'+record[0]+'</option>'
-  name_html+=temp
+version_query='''MERGE (version:GraphVersion {name: 'graph'})
+SET version.version = randomUUID(), version.ingested_at = datetime()
+'''
 
-html_content="""
+def ingest(conn, url=SAMPLE_DATA_URL):
+    # The graph may have changed, so nothing cached from the previous load is valid, here or in
+    # any serving process, which sees the new GraphVersion on its next check_graph_version
+    res=conn.query(query, {'url': url})
+    if res is not None:
+        conn.query(version_query)
+    invalidate_caches()
+    return res
+
+def neo4j_connection():
+    return Neo4jConnection(uri=os.environ.get('KG_NEO4J_URI', "bolt://54.162.95.224:7687"), user=os.environ.get('KG_NEO4J_USER', "neo4j"),
+                           pwd=os.environ.get('KG_NEO4J_PASSWORD', "thickness-receptacles-evacuation"))
+
+# Created on first use, so importing this module connects to nothing
+graph_backend = None
+backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Returns the backend the app serves from. KG_BACKEND=memory serves
+    sample_data.csv (or KG_DATA) from memory, with no Neo4j server.
+    """
+    global graph_backend
+    with backend_lock:
+        if graph_backend is None:
+            if os.environ.get('KG_BACKEND') == 'memory':
+                graph_backend = InMemoryBackend.from_csv(os.environ.get('KG_DATA', 'sample_data.csv'))
+            else:
+                graph_backend = Neo4jBackend(neo4j_connection())
+        return graph_backend
+
+def write_index(movies, path='index.html'):
+    """Writes the page of the app, with every movie as an option of its three selects."""
+    name_html=''
+    for movie in movies:
+        temp='\n\t\t\t\t\t<option value="'+movie+'">'+movie+'</option>'
+        name_html+=temp
+
+    html_content="""
 <!DOCTYPE html>
 <html>
 <head>
@@ -192,12 +343,11 @@ html_content="""
 </body>
 </html>
 """
-
-with open('index.html', 'w') as f:
-    f.write(html_content)
+    with open(path, 'w') as f:
+        f.write(html_content)
 
 # my_flask_app/app.py
-from flask import Flask, render_template, request
+from flask import Flask, jsonify, render_template, request
 
 app = Flask(__name__)
 
@@ -216,61 +366,78 @@ def submit():
     # Render template with recommendations
     return render_template('index.html',movies=movies, recommendations_actor_director=recommendations_actor_director,recommendations_genre=recommendations_genre)
 
-def recomendation_system(movie1,movie2,movie3):
-    fav_genre=[]
-    fav_actor=[]
-    fav_director=[]
-
-    for movie in (movie1,movie2,movie3):
-        query = "MATCH (genre:Genre)<-[s:GENRE_IS]-(movie:Movie {name: '"+movie+"'}) RETURN genre.name"
-        result = conn.query(query)
-        for each in result:fav_genre.append(each['genre.name'])
-
-        query = "MATCH (actor:Actor)-[s:ACTED_IN]->(movie:Movie {name: '"+movie+"'}) RETURN actor.name"
-        result = conn.query(query)
-        for each in result:fav_actor.append(each['actor.name'])
-
-        query = "MATCH (director:Director)-[s:DIRECTED]->(movie:Movie {name: '"+movie+"'}) RETURN director.name"
-        result = conn.query(query)
-        for each in result:fav_director.append(each['director.name'])
-
-    fav_genre=set(fav_genre)
-    fav_actor=set(fav_actor)
-    fav_director=set(fav_director)
+@app.route('/cache_stats')
+def cache_stats_view():
+    return jsonify(cache_stats())
+
+def movie_favourites(movies, backend):
+    # Only movies missing from the cache go to the backend
+    favourites = {}
+    missing = []
+    for movie in movies:
+        cached = favourites_cache.get((backend, movie))
+        if cached is None:missing.append(movie)
+        else:favourites[movie] = cached
+
+    if missing:
+        found = backend.favourites(missing)
+        for movie in missing:
+            favourites[movie] = (found or {}).get(movie, (frozenset(), frozenset(), frozenset()))
+            if found:favourites_cache.set((backend, movie), favourites[movie])
+
+    return favourites
+
+def recomendation_system(movie1,movie2,movie3,backend=None):
+    backend = backend or get_backend()
+    check_graph_version(backend)
+    key = (backend, frozenset((movie1, movie2, movie3)))
+    cached = recommendations_cache.get(key)
+    if cached is not None:
+        return [movie1,movie2,movie3], set(cached[0]), set(cached[1])
+
+    favourites = movie_favourites(key[1], backend)
+    fav_genre=set().union(*(genres for genres, actors, directors in favourites.values()))
+    fav_actor=set().union(*(actors for genres, actors, directors in favourites.values()))
+    fav_director=set().union(*(directors for genres, actors, directors in favourites.values()))
 
     print('\nFavorites\n')
     print('Genres :',fav_genre)
     print('Actors :',fav_actor)
     print('Directors :',fav_director)
 
-    recommendations_actor_director=[]
-
-    for each in fav_actor:
-        query = "MATCH (actor:Actor {name: '"+each+"'})-[s:ACTED_IN]->(movie:Movie) RETURN movie.name"
-        result = conn.query(query)
-        for each in result:recommendations_actor_director.append(each['movie.name'])
-
-    for each in fav_director:
-        query = "MATCH (director:Director {name: '"+each+"'})-[s:DIRECTED]->(movie:Movie) RETURN movie.name"
-        result = conn.query(query)
-        for each in result:recommendations_actor_director.append(each['movie.name'])
+    result = backend.candidates(fav_actor, fav_director, fav_genre, sentiments=('Best', 'Good'), genre_limit=10)
 
     print('\nRecommendations based on actors and directors\n')
-    recommendations_actor_director=set(recommendations_actor_director)
+    recommendations_actor_director=set(result[0]) if result else set()
     #for each in recommendations_actor_director:print(each)
 
-    recommendations_genre=[]
-    for each in fav_genre:
-        query = "MATCH (genre:Genre {name: '"+each+"'})<-[s:GENRE_IS]-(movie:Movie) RETURN movie.name"
-        result = conn.query(query)
-        for each in result:
-          if each['movie.sentiment'] in ['Best','Good']:
-            recommendations_genre.append(each['movie.name'])
-
     print('\nRecommendations based on genre and sentiment analysis\n')
-    recommendations_genre=set(recommendations_genre[:10])
+    recommendations_genre=set(result[1]) if result else set()
     #for each in recommendations_genre:print(each)
 
+    if result:recommendations_cache.set(key, (frozenset(recommendations_actor_director), frozenset(recommendations_genre)))
+
     return [movie1,movie2,movie3],recommendations_actor_director, recommendations_genre
+
+def main(command=None, url=SAMPLE_DATA_URL, index_path='index.html', port=8000):
+    """
+    Runs the ingest stage, which loads the CSV at url into Neo4j, the serve
+    stage, which writes the page of the app and serves it on port, or both
+    when command is None. With KG_BACKEND=memory there is nothing to ingest.
+
+    Returns:
+        bool: False when the ingest failed, for instance because Neo4j could not read url.
+    """
+    ingested = True
+    if command in (None, 'ingest') and os.environ.get('KG_BACKEND') != 'memory':
+        with neo4j_connection() as conn:
+            ingested = ingest(conn, url) is not None
+        print(f'Ingested {url}' if ingested else f'Error: could not ingest {url}')
+    if command in (None, 'serve'):
+        write_index(get_backend().movie_names(), index_path)
+        app.run(debug=True, port=port)
+    return ingested
+
 if __name__ == '__main__':
-    app.run(debug=True, port=8000)
+    # python recommendation.py [ingest|serve] [csv url]
+    main(sys.argv[1] if len(sys.argv) > 1 else None, sys.argv[2] if len(sys.argv) > 2 else SAMPLE_DATA_URL)
@@ -1,159 +1,225 @@
-from bs4 import BeautifulSoup
 import requests
-import pandas as pd
 import os
-from IPython.display import FileLink
 import re
 import time
-from os import replace
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
 # from neo4j import GraphDatabase
 
-title_list=[]
-year_list=[]
-duration_list=[]
-rated_list=[]
-actor_list=[]
-director_list=[]
-rating_list=[]
-genre_list=[]
-comments_list=[]
-
-def movie_scrapping(url,title_list,year_list,duration_list,rated_list,actor_list,director_list,rating_list,genre_list,comments_list):#,nlp_score,sentiment_list):
-  HEADERS = {'User-Agent': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'}
-  page = requests.get(url, headers=HEADERS)
-  soup = BeautifulSoup(page.content, "html.parser")
-
-  def fetch_movies(soup,title_list,year_list,duration_list,rated_list):
-    for i in soup.find_all('a',class_="ipc-title-link-wrapper"):
-      title=i.get_text(strip=True)
-      title=title[title.index('.')+2:]
-      title_list.append(title)
-
-    year_rated_duration=(soup.find_all('span',class_="sc-b189961a-8 kLaxqf dli-title-metadata-item"))
-
-    count=0
-    while len(year_list)!=len(title_list):
-      try:
-        year=year_rated_duration[count].get_text(strip=True)
-        duartion=year_rated_duration[count+1].get_text(strip=True)
-        rated=year_rated_duration[count+2].get_text(strip=True)
-
-        if year.isnumeric()==True and duartion.isnumeric()==True:
-          year_list.append(year)
-          duration_list.append('na')
-          rated_list.append('na')
-          count+=1
-        elif year.isnumeric()==True and duartion.isnumeric()!=True:
-          for each in (year,duartion,rated):
-            if len(str(each))==4:year_list.append(year)
-            if 'h' in duartion:duration_list.append(duartion)
-            if rated in ['Aprroved','NC-17','TV-MA','G','PG','PG-13','R','Not Rated']:rated_list.append(each)
-          count+=3
-      except:pass
-
-    # for each in range(len(year_rated_duration)-2):
-    #   year=year_rated_duration[each].get_text(strip=True)
-    #   duartion=year_rated_duration[each+1].get_text(strip=True)
-    #   rated=year_rated_duration[each+2].get_text(strip=True)
-
-    #   if year.isnumeric()==False:pass
-    #   else:
-    #     year_list.append(year)
-    #     if 'h' and 'm' in duartion:duration_list.append(duartion)
-    #     else:duration_list.append(None)
-    #     if rated in ['Aprroved','NC-17','TV-MA','G','PG','PG-13','R']:rated_list.append(rated)
-    #     else:rated_list.append(None)
-
-    return title_list,year_list,duration_list,rated_list
-
-  title_list,year_list,duration_list,rated_list=fetch_movies(soup,title_list,year_list,duration_list,rated_list)
-
-  sub_links=[]
-
-  def get_sublinks(soup,sub_links):
-    movies_list=soup.find_all('a',class_='ipc-title-link-wrapper')
-    for each in movies_list:
-      sub_links.append(each.get('href'))
-    return sub_links
-
-  sub_links=get_sublinks(soup,sub_links)
-
-  rooturl='https://www.imdb.com'
-
-  for sub in sub_links:
+from frontier import CrawlFrontier
+from httpcache import ResponseCache
+from movierecord import MovieRecord, write_records
+from pageparser import parse_listing, parse_reviews_page, parse_title_page
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'}
+
+def title_id(href):
+  return re.search(r'/title/(tt\d+)',href).group(1)
+
+def review_url(url):
+  index=url.index('?ref')
+  return url[:index]+'reviews?ref_=tt_urv'
+
+# Several actors, directors or genres are joined with ':', which the graph ingestion splits on. None
+# leaves the cell empty, so no placeholder node links every title missing that field
+def joined(values):
+  return ':'.join(values)
+
+def title_record(sub,name,year,duration,rated,page,page1):
+  """Builds the MovieRecord of a listing entry from its title and reviews pages."""
+  fields=parse_title_page(page)
+  return MovieRecord(title_id(sub),name,year if year!='na' else fields['year'] or 'na',duration if duration!='na' else fields['duration'] or 'na',
+                     rated if rated!='na' else fields['rated'] or 'na',joined(fields['actors']),joined(fields['directors']),fields['rating'] or 'na',
+                     joined(fields['genres']),parse_reviews_page(page1))
+
+def get_page(url,cache=None):
+  """Returns the body of url, served or revalidated through cache when one is given."""
+  headers={}
+  if cache!=None:
+    entry,headers=cache.cached(url)
+    if entry!=None:return entry.body
+  page = requests.get(url, headers={**HEADERS,**headers})
+  # Like AsyncFetcher.get, so a block or error page is never parsed as an empty one
+  page.raise_for_status()
+  if cache==None:return page.content
+  return cache.update(url,page.status_code,page.headers,page.content)
+
+def movie_scrapping(url,rooturl='https://www.imdb.com',cache=None):
+  """
+  Yields a MovieRecord for every title of one listing page, fetching the pages one at a time.
+  Raises requests.HTTPError when the listing page is a 4xx or 5xx; a failing title is skipped.
+  """
+  for sub,name,year,duration,rated in parse_listing(get_page(url,cache)):
     url=rooturl+sub
-    HEADERS = {'User-Agent': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'}
-    page = requests.get(url, headers=HEADERS)
-    soup = BeautifulSoup(page.content, "html.parser")
-
-    cast=soup.find('a',class_='sc-bfec09a1-1 gCQkeh')
-    actor_list.append(cast.get_text(strip=True))
-
-    director=soup.find('a',class_="ipc-metadata-list-item__list-content-item ipc-metadata-list-item__list-content-item--link")
-    director_list.append(director.get_text(strip=True))
-
-    rating=soup.find('span',class_="sc-eb51e184-1 cxhhrI")
-    if rating==None:rating_list.append(None)
-    else:rating_list.append(rating.get_text(strip=True))
-
-    genre=soup.find('span',class_="ipc-chip__text")
-    genre_list.append(genre.get_text(strip=True))
-
-    index=(rooturl+sub).index('?ref')
-
-    comment_url=(rooturl+sub)[:index]+'reviews?ref_=tt_urv'
-    HEADERS = {'User-Agent': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148'}
-    page1 = requests.get(comment_url, headers=HEADERS)
-    soup1 = BeautifulSoup(page1.content, "html.parser")
-
-    temp=[]
-    for comment in soup1.find_all('a',class_='title'):
-      temp.append(comment.get_text(strip=True))
-
-    comments_list.append(temp)
-
-  lists=[title_list,year_list,duration_list,rated_list,rating_list,director_list]
-  for col in lists:
-    for row in col:
-      if row==None:col[int(col.index(row))]='na'
-
-  return title_list,year_list,duration_list,rated_list,actor_list,director_list,rating_list,genre_list,comments_list#,nlp_score,sentiment_list
-
-
-# genre=('action','adventure','animation','biography','comedy','crime')#,'documentary','drama','family','fantasy','film-Noir','game-Show','history','horror','music','musical','mystery','news','reality-TV','romance','sci-Fi','short','sport','talk-Show','thriller','war','western')
-# for each in genre:
-#   url='https://www.imdb.com/search/title/?title_type=feature&genres='+each
-
-# x=0
-# while x<=10:
-url='https://www.imdb.com/search/title/?title_type=feature&user_rating='+str(10)+','+str(9)#+str(i/100)+','+str((i/100)-0.50)
-
-f1,f2,f3,f4,f5,f6,f7,f8,f9=movie_scrapping(url,title_list,year_list,duration_list,rated_list,actor_list,director_list,rating_list,genre_list,comments_list)# ,nlp_score,sentiment_list)
-title_list+=f1
-year_list+=f2
-duration_list+=f3
-rated_list+=f4
-actor_list+=f5
-director_list+=f6
-rating_list+=f7
-genre_list+=f8
-comments_list+=f9
-
-  # x+=0.1
-
-# for j in range(10):
-#   for i in range(10)
-#     url='https://www.imdb.com/search/title/?title_type=feature&user_rating='+str(i)+','+str(i-1)#+str(i/100)+','+str((i/100)-0.50)
-
-#     f1,f2,f3,f4,f5,f6,f7,f8,f9=movie_scrapping(url,title_list,year_list,duration_list,rated_list,actor_list,director_list,rating_list,genre_list,comments_list)# ,nlp_score,sentiment_list)
-#     title_list+=f1
-#     year_list+=f2
-#     duration_list+=f3
-#     rated_list+=f4
-#     actor_list+=f5
-#     director_list+=f6
-#     rating_list+=f7
-#     genre_list+=f8
-#     comments_list+=f9
-#     # nlp_score+=f10
-#     # sentiment_list+=f11
\ No newline at end of file
+    try:
+      yield title_record(sub,name,year,duration,rated,get_page(url,cache),get_page(review_url(url),cache))
+    except Exception as e:
+      print(f"Error scraping {url}: {e!r}")
+
+
+class HostRateLimiter:
+  """Spaces out the requests to each host so that at most rate of them start per second."""
+
+  def __init__(self,rate=None):
+    self.interval=1/rate if rate else 0
+    self.next_start={}
+    self.lock=asyncio.Lock()
+
+  async def wait(self,host):
+    async with self.lock:
+      now=time.monotonic()
+      start=max(now,self.next_start.get(host,now))
+      self.next_start[host]=start+self.interval
+    if start>now:await asyncio.sleep(start-now)
+
+
+class AsyncFetcher:
+  """
+  Shared keep-alive aiohttp client for the scraper.
+
+  At most concurrency requests are in flight at once, and each host gets at
+  most rate_per_host new requests per second. Use it as an async context
+  manager so the connection pool is closed at the end of the crawl. With a
+  httpcache.ResponseCache, cached pages are served from disk or revalidated
+  with a conditional request.
+  """
+
+  def __init__(self,concurrency=8,rate_per_host=4.0,timeout=30,cache=None):
+    self.concurrency=concurrency
+    self.cache=cache
+    self.timeout=timeout
+    self.semaphore=asyncio.Semaphore(concurrency)
+    self.limiter=HostRateLimiter(rate_per_host)
+    self.session=None
+
+  async def __aenter__(self):
+    connector=aiohttp.TCPConnector(limit=self.concurrency,ttl_dns_cache=300)
+    self.session=aiohttp.ClientSession(connector=connector,headers=HEADERS,timeout=aiohttp.ClientTimeout(total=self.timeout))
+    return self
+
+  async def __aexit__(self,*exc):
+    await self.session.close()
+
+  async def get(self,url):
+    headers={}
+    if self.cache!=None:
+      entry,headers=self.cache.cached(url)
+      if entry!=None:return entry.body
+    async with self.semaphore:
+      await self.limiter.wait(urlsplit(url).netloc)
+      async with self.session.get(url,headers=headers) as response:
+        body=await response.read()
+        # A 4xx or 5xx page, such as a rate limit, is an error rather than an empty listing or title
+        response.raise_for_status()
+    if self.cache==None:return body
+    return self.cache.update(url,response.status,response.headers,body)
+
+async def scrape_record(fetcher,rooturl,sub,name,year,duration,rated):
+  """
+  Fetches the title page and its reviews page concurrently and returns the
+  entry's MovieRecord, or None when its pages fail to load or parse.
+  """
+  url=rooturl+sub
+  try:
+    page,page1=await asyncio.gather(fetcher.get(url),fetcher.get(review_url(url)))
+    return title_record(sub,name,year,duration,rated,page,page1)
+  except Exception as e:
+    print(f"Error scraping {url}: {e!r}")
+    return None
+
+async def movie_scrapping_async(url,rooturl='https://www.imdb.com',concurrency=8,rate_per_host=4.0,cache=None):
+  """
+  Same as movie_scrapping, but fetches every title and reviews page concurrently
+  through one AsyncFetcher, yielding the records as their titles finish.
+  """
+  async with AsyncFetcher(concurrency,rate_per_host,cache=cache) as fetcher:
+    page=await fetcher.get(url)
+    for record in asyncio.as_completed([scrape_record(fetcher,rooturl,*entry) for entry in parse_listing(page)]):
+      record=await record
+      if record!=None:yield record
+
+async def crawl(frontier,rooturl='https://www.imdb.com',concurrency=8,rate_per_host=4.0,cache=None,max_pages=None):
+  """
+  Walks the pending listing pages of a frontier.CrawlFrontier and scrapes every
+  title it has not seen yet, concurrently within a page. Each record is
+  appended as soon as its title is done, and a page is marked done once all of
+  its titles are; a listing whose page or one of whose titles fails is left
+  for the next run, and the crawl moves on to the next listing.
+  Returns the number of new records.
+  """
+  added=0
+  pages=0
+  async with AsyncFetcher(concurrency,rate_per_host,cache=cache) as fetcher:
+    for genre,band,start in frontier.pending():
+      while start!=None and (max_pages==None or pages<max_pages):
+        url=frontier.listing_url(rooturl,genre,band,start)
+        try:
+          entries=list(parse_listing(await fetcher.get(url)))
+        except Exception as e:
+          # A listing that fails to load, times out or is missing in replay mode is left for the next run
+          print(f"Error fetching listing {url}: {e!r}")
+          break
+
+        failed=0
+        for record in asyncio.as_completed([scrape_record(fetcher,rooturl,*entry) for entry in entries if title_id(entry[0]) not in frontier.seen]):
+          record=await record
+          if record==None:
+            failed+=1
+            continue
+          frontier.add_record(record.to_row())
+          added+=1
+
+        pages+=1
+        if failed:break
+        start=frontier.finish_page(genre,band,start,len(entries))
+  return added
+
+def main(output='scraped_data.csv',crawl_dir='crawl',rooturl='https://www.imdb.com',concurrency=8,rate_per_host=4.0,
+         http_cache='http_cache.sqlite',replay=False,max_age=None,max_pages=None):
+  """
+  Scrape stage: crawls the pending listing pages into crawl_dir, then streams
+  every crawled record to output (.csv, or .parquet with pyarrow).
+
+  Args:
+    output (str, optional): The scraped records. Defaults to "scraped_data.csv".
+    crawl_dir (str, optional): The frontier.CrawlFrontier directory. Defaults to "crawl".
+    rooturl (str, optional): The host to scrape. Defaults to IMDb.
+    concurrency (int, optional): Requests in flight. Defaults to 8.
+    rate_per_host (float, optional): New requests per second and host. Defaults to 4.
+    http_cache (str, optional): The httpcache.ResponseCache file, or None to
+      disable it. Defaults to "http_cache.sqlite".
+    replay (bool, optional): Only serve pages from http_cache. Defaults to False.
+    max_age (float, optional): Serve cached pages younger than this many
+      seconds without revalidating them. Defaults to None.
+    max_pages (int, optional): Listing pages fetched in this run. Defaults to None, no limit.
+
+  Returns:
+    int: The number of records written.
+  """
+  cache=ResponseCache(http_cache,replay_only=replay,max_age=max_age) if http_cache else None
+  frontier=CrawlFrontier(crawl_dir)
+  added=asyncio.run(crawl(frontier,rooturl,concurrency,rate_per_host,cache,max_pages))
+  print(f'Scraped {added} new titles, {len(frontier.seen)} in total')
+  if cache!=None:
+    print('HTTP cache:',cache.stats())
+    cache.close()
+
+  written=write_records((MovieRecord.from_row(row) for row in frontier.records()),output)
+  print(f'Wrote {written} records')
+  return written
+
+
+if __name__=='__main__':
+  # KG_ROOT_URL points the scraper at another host, such as a local server with saved pages.
+  # Pages are kept in KG_HTTP_CACHE (empty to disable); KG_REPLAY=1 never touches the network and
+  # KG_CACHE_MAX_AGE serves pages younger than that many seconds without revalidating them.
+  # Progress and records are appended to KG_CRAWL_DIR, so an interrupted crawl resumes where it stopped
+  # and titles scraped by earlier runs are skipped; KG_MAX_PAGES bounds the listing pages fetched per run
+  max_age=os.environ.get('KG_CACHE_MAX_AGE')
+  max_pages=os.environ.get('KG_MAX_PAGES')
+  main(output=os.environ.get('KG_OUTPUT','scraped_data.csv'),crawl_dir=os.environ.get('KG_CRAWL_DIR','crawl'),
+       rooturl=os.environ.get('KG_ROOT_URL','https://www.imdb.com'),concurrency=int(os.environ.get('KG_CONCURRENCY',8)),
+       rate_per_host=float(os.environ.get('KG_RATE_PER_HOST',4.0)),http_cache=os.environ.get('KG_HTTP_CACHE','http_cache.sqlite'),
+       replay=os.environ.get('KG_REPLAY')=='1',max_age=float(max_age) if max_age else None,max_pages=int(max_pages) if max_pages else None)
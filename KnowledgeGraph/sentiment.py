@@ -0,0 +1,213 @@
+# Batched sentiment scoring for nlp.py
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+import hashlib
+import sqlite3
+import unicodedata
+
+import numpy as np
+
+SCORERS = ('textblob', 'vader')
+
+# One analyzer per scorer and process, built on first use
+analyzers = {}
+
+def polarity_function(scorer):
+    """Returns a function mapping a text to its polarity in [-1, 1] with the given scorer."""
+    if scorer not in analyzers:
+        # Each scorer's library takes a second or more to import, so only the chosen one is imported
+        if scorer == 'textblob':
+            from textblob.en.sentiments import PatternAnalyzer
+
+            # What TextBlob(text).sentiment.polarity runs, without building a TextBlob per text
+            analyzer = PatternAnalyzer()
+            analyzers[scorer] = lambda text: analyzer.analyze(text).polarity
+        elif scorer == 'vader':
+            from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+            analyzer = SentimentIntensityAnalyzer()
+            analyzers[scorer] = lambda text: analyzer.polarity_scores(text)['compound']
+        else:
+            raise ValueError(f'Unknown scorer {scorer}, expected one of {SCORERS}.')
+    return analyzers[scorer]
+
+def score_texts(texts, scorer='textblob'):
+    """Returns the float64 polarity of every text."""
+    polarity = polarity_function(scorer)
+    return np.array([polarity(str(text)) for text in texts], dtype=np.float64)
+
+def score_comments(texts, scorer='textblob', processes=None, chunk_size=1000):
+    """
+    Scores texts in chunks of chunk_size, across processes worker processes.
+    Defaults to None, which scores them in this process.
+    """
+    if len(texts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    if not processes or processes <= 1 or len(chunks) == 1:
+        return np.concatenate([score_texts(chunk, scorer) for chunk in chunks])
+    with ProcessPoolExecutor(processes) as executor:
+        return np.concatenate(list(executor.map(score_texts, chunks, [scorer] * len(chunks))))
+
+def normalize_text(text):
+    """NFC with runs of whitespace collapsed, which changes no scorer's result but merges more repeats."""
+    return ' '.join(unicodedata.normalize('NFC', str(text)).split())
+
+def scorer_version(scorer):
+    """Identifies the scorer and the version of its library, so an upgrade invalidates cached scores."""
+    package = {'textblob': 'textblob', 'vader': 'vaderSentiment'}.get(scorer)
+    if package is None:
+        raise ValueError(f'Unknown scorer {scorer}, expected one of {SCORERS}.')
+    return f'{scorer}-{metadata.version(package)}'
+
+class SentimentCache:
+    """
+    Polarity of every text already scored, kept in one SQLite file.
+
+    Scores are keyed on a 16-byte BLAKE2 hash of the scorer version and the
+    normalized text. hits and misses count the distinct texts looked up.
+    """
+
+    def __init__(self, path='sentiment_cache.sqlite'):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, polarity REAL NOT NULL) WITHOUT ROWID')
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(version, text):
+        return hashlib.blake2b(f'{version}\0{text}'.encode('utf-8'), digest_size=16).digest()
+
+    def lookup(self, keys, batch_size=500):
+        """Returns {key: polarity} for the keys that are cached."""
+        found = {}
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            found.update(self.db.execute(f'SELECT key, polarity FROM scores WHERE key IN ({",".join("?" * len(batch))})', batch))
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def store(self, keys, polarities):
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO scores (key, polarity) VALUES (?, ?)', zip(keys, map(float, polarities)))
+
+    def stats(self):
+        looked_up = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / looked_up if looked_up else 0.0}
+
+def cached_scores(texts, scorer='textblob', processes=None, chunk_size=1000, cache=None):
+    """
+    Returns the polarity of every text, scoring each distinct normalized text
+    once and only when cache, a SentimentCache, does not already have it.
+    """
+    positions = {}
+    inverse = np.array([positions.setdefault(normalize_text(text), len(positions)) for text in texts], dtype=np.int64)
+    unique = list(positions)
+    polarity = np.zeros(len(unique), dtype=np.float64)
+
+    missing = list(range(len(unique)))
+    if cache is not None:
+        version = scorer_version(scorer)
+        keys = [cache.key(version, text) for text in unique]
+        found = cache.lookup(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        for i, key in enumerate(keys):
+            if key in found:
+                polarity[i] = found[key]
+
+    scores = score_comments([unique[i] for i in missing], scorer, processes, chunk_size)
+    polarity[missing] = scores
+    if cache is not None:
+        cache.store([keys[i] for i in missing], scores)
+    return polarity[inverse]
+
+def flatten_comments(movies, max_comments=20):
+    """
+    Flattens (movie_id, comments) pairs into one list of texts.
+
+    Returns:
+        tuple: (movie_ids, movie_index, texts), where texts holds the first
+            max_comments comments of every movie and movie_index gives the
+            position of their movie.
+    """
+    movie_ids, movie_index, texts = [], [], []
+    for position, (movie_id, comments) in enumerate(movies):
+        scored = list(comments)[:max_comments]
+        movie_ids.append(movie_id)
+        texts.extend(scored)
+        movie_index.extend([position] * len(scored))
+    return movie_ids, np.array(movie_index, dtype=np.int64), texts
+
+# Right edges of the very bad, bad, neutral (exactly 0) and good buckets; anything above is very good.
+# With np.digitize, -0.5 falls in bad, 0.5 in good and only exact zeros in neutral
+BUCKET_EDGES = np.array([-0.5, 0, np.nextafter(0.0, 1.0), np.nextafter(0.5, 1.0)], dtype=np.float64)
+NEUTRAL_BUCKET = 2
+
+# A movie's label is that of its most common bucket, ties going to the better one
+LABELS = np.array(['Best', 'Good', 'Bad', 'Worst'])
+
+def aggregate_sentiment(movie_index, polarity, num_movies):
+    """
+    Sums up a flat array of comment polarities per movie in linear time.
+
+    Args:
+        movie_index (np.ndarray): The movie of every comment.
+        polarity (np.ndarray): The float64 polarity of every comment.
+        num_movies (int): The number of movies.
+
+    Returns:
+        tuple: (mean, counts, labels), where mean is the mean polarity of a
+            movie's scored comments (0 without any), counts an int64 array of
+            shape (num_movies, 4) counting its very bad, bad, good and very
+            good comments, and labels its Best/Good/Bad/Worst label, or
+            Neutral when it has no non-zero comment.
+    """
+    scored = np.bincount(movie_index, minlength=num_movies)
+    sums = np.bincount(movie_index, weights=polarity, minlength=num_movies)
+    mean = sums / np.maximum(scored, 1)
+
+    buckets = np.digitize(np.asarray(polarity, dtype=np.float64), BUCKET_EDGES)
+    counts = np.bincount(movie_index * 5 + buckets, minlength=num_movies * 5).reshape(num_movies, 5)
+    counts = np.delete(counts, NEUTRAL_BUCKET, axis=1)
+
+    # Columns from best to worst, so argmax breaks ties towards the better label
+    best_first = counts[:, ::-1]
+    labels = LABELS[best_first.argmax(axis=1)]
+    labels = np.where(best_first.max(axis=1, initial=0) == 0, 'Neutral', labels)
+    return mean, counts, labels
+
+def sentiment_stage(movies, scorer='textblob', processes=None, chunk_size=1000, max_comments=20, cache=None):
+    """
+    Scores the first max_comments comments of every movie and sums them up per movie.
+
+    Args:
+        movies (iterable): (movie_id, comments) pairs.
+        scorer (str, optional): "textblob" or "vader". Defaults to "textblob".
+        processes (int, optional): The number of worker processes. Defaults
+            to None, which scores in this process.
+        chunk_size (int, optional): Comments per task sent to a worker.
+            Defaults to 1000.
+        max_comments (int, optional): Comments scored per movie. Defaults to 20.
+        cache (SentimentCache, optional): Scores kept from earlier runs; only
+            texts it lacks are scored, and their scores are added to it.
+            Defaults to None.
+
+    Returns:
+        tuple: (movie_ids, nlp_score, counts, labels), with the last three as
+            returned by aggregate_sentiment.
+    """
+    movie_ids, movie_index, texts = flatten_comments(movies, max_comments)
+    polarity = cached_scores(texts, scorer, processes, chunk_size, cache)
+    return (movie_ids, *aggregate_sentiment(movie_index, polarity, len(movie_ids)))
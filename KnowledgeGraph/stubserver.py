@@ -0,0 +1,140 @@
+# Local stand-in for IMDb serving the saved pages in fixtures/, for trying the scraper offline
+
+import asyncio
+import hashlib
+import os
+import re
+import string
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+GENRES = ('Action', 'Comedy', 'Crime', 'Sci-Fi', 'Thriller')
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return string.Template(f.read())
+
+def title_fields(number):
+    """The made-up details of title number, filled into the fixtures."""
+    return {'tt': f'tt{number:07d}', 'name': f'Movie {number}', 'year': str(1980 + number % 40), 'minutes': str(number % 60),
+            'duration': f'2h {number % 60}m', 'rated': ('PG', 'PG-13', 'R')[number % 3], 'rating': f'{1 + number % 9}.{number % 10}',
+            'genre': GENRES[number % len(GENRES)], 'actor': f'Actor {number}', 'actor_id': f'{number:07d}',
+            'director': f'Director {number % 97}'}
+
+class StubIMDb(BaseHTTPRequestHandler):
+    """
+    Serves /search/title listings, /title/tt<number>/ pages and their
+    /reviews pages. A listing holds per_listing titles, page_size at a time,
+    picked from universe titles by its genre and rating band, so listings
+    overlap like they do on IMDb. Every fifth title page has no JSON-LD
+    block, which exercises the CSS fallback. Responses carry an ETag and a
+    matching If-None-Match gets a 304. hits and not_modified count requests.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    universe = 3000
+    per_listing = 120
+    page_size = 50
+    hits = 0
+    not_modified = 0
+
+    def listing(self, url):
+        query = parse_qs(urlsplit(url).query)
+        start = int(query.get('start', ['1'])[0])
+        seed = sum(map(ord, query.get('genres', [''])[0])) * 7 + int(query.get('user_rating', ['0,1'])[0].split(',')[0]) * 13
+        item = fixture('listing_item.html')
+        items = ''.join(item.substitute(title_fields((seed + k) % self.universe), position=k + 1)
+                        for k in range(start - 1, min(start - 1 + self.page_size, self.per_listing)))
+        return fixture('listing.html').substitute(items=items)
+
+    def page(self):
+        if self.path.startswith('/search/'):
+            return self.listing(self.path)
+        match = re.match(r'/title/tt(\d+)/(reviews)?', self.path)
+        if match is None:
+            return None
+        number = int(match.group(1))
+        if match.group(2):
+            return fixture('reviews.html').substitute(title_fields(number))
+        return fixture('title_no_ld.html' if number % 5 == 0 else 'title.html').substitute(title_fields(number))
+
+    def do_GET(self):
+        type(self).hits += 1
+        time.sleep(self.delay)
+        page = self.page()
+        if page is None:
+            self.send_error(404)
+            return
+        body = page.encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start(port=0, delay=0.0):
+    """Serves the stub on 127.0.0.1:port (0 picks a free port) from a daemon thread and returns the server."""
+    StubIMDb.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubIMDb)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def check(delay=0.05):
+    """Scrapes one listing with movie_scrapping_async, then crawls two listings into a temporary directory."""
+    from frontier import CrawlFrontier
+    from httpcache import ResponseCache
+    from scrapping import crawl, movie_scrapping_async
+
+    server = start(delay=delay)
+    rooturl = f'http://127.0.0.1:{server.server_address[1]}'
+
+    async def scrape_listing(url):
+        return [record async for record in movie_scrapping_async(url, rooturl, rate_per_host=0)]
+
+    started = time.perf_counter()
+    records = asyncio.run(scrape_listing(rooturl + '/search/title/?genres=drama&user_rating=8,9'))
+    print(f'movie_scrapping_async: {len(records)} titles in {time.perf_counter() - started:.2f}s')
+    print(min(records, key=lambda record: record.id))
+    assert len(records) == StubIMDb.page_size and all(record.actor and len(record.comments) == 4 for record in records)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with ResponseCache(os.path.join(directory, 'http_cache.sqlite')) as cache:
+            frontier = CrawlFrontier(os.path.join(directory, 'crawl'), genres=('drama', 'comedy'), rating_bands=((8, 9),))
+            added = asyncio.run(crawl(frontier, rooturl, rate_per_host=0, cache=cache, max_pages=2))
+            print(f'crawl, first run: {added} titles, {StubIMDb.hits} requests so far')
+            assert added == 2 * StubIMDb.page_size
+
+            # Resumes at the third listing page; the second run over the stub finishes the pass
+            frontier = CrawlFrontier(os.path.join(directory, 'crawl'), genres=('drama', 'comedy'), rating_bands=((8, 9),))
+            added = asyncio.run(crawl(frontier, rooturl, rate_per_host=0, cache=cache))
+            print(f'crawl, resumed: {added} more titles, {len(frontier.seen)} in total, pass finished: {frontier.pass_finished()}')
+            assert frontier.pass_finished() and len(frontier.seen) == len({record['Id'] for record in frontier.records()})
+    server.shutdown()
+
+if __name__ == '__main__':
+    # python stubserver.py          checks the scraper against the stub
+    # python stubserver.py serve 8080   serves it, for KG_ROOT_URL=http://127.0.0.1:8080 python scrapping.py
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        server = start(int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
+        print(f'Serving the stub on http://127.0.0.1:{server.server_address[1]}')
+        threading.Event().wait()
+    else:
+        check()
@@ -0,0 +1,360 @@
+# kgrec: runs the scraping, graph and embedding pipelines as one DAG of stages
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import urllib.parse
+from dataclasses import dataclass, field
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(ROOT, 'KnowledgeGraph'), os.path.join(ROOT, 'EmbeddingRecomender')]
+
+# File or directory of every artifact, relative to the work directory
+PATHS = {
+    'crawl': 'crawl',
+    'http_cache': 'http_cache.sqlite',
+    'scraped': 'scraped_data.csv',
+    'sentiment_cache': 'sentiment_cache.sqlite',
+    'sentiment': 'sentiment_data.csv',
+    'sample_data': 'sample_data.csv',
+    'graph': 'graph',
+    'relations': 'relations.json',
+    'nodes': 'nodes.json',
+    'triples': 'output.csv',
+    'embeddings': 'embeddings',
+}
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline. run(paths, params, options) reads the inputs and
+    writes the outputs, both keys of PATHS, and returns whether it succeeded.
+    params change the outputs, so they are part of the fingerprint; options,
+    such as worker counts, do not.
+    """
+    name: str
+    run: object
+    inputs: tuple = ()
+    outputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    options: dict = field(default_factory=dict)
+
+# The stage modules are only imported when their stage runs. The KnowledgeGraph stages raise on
+# errors, while the others print them and return False
+
+def scrape(paths, params, options):
+    import scrapping
+    scrapping.main(output=paths['scraped'], crawl_dir=paths['crawl'], rooturl=params['rooturl'], max_pages=params['max_pages'],
+                   concurrency=options['concurrency'], rate_per_host=options['rate_per_host'], http_cache=paths['http_cache'],
+                   replay=options['replay'], max_age=options['max_age'])
+    return True
+
+def sentiment(paths, params, options):
+    import nlp
+    nlp.main(input=paths['scraped'], output=paths['sentiment'], scorer=params['scorer'], processes=options['processes'],
+             cache_path=paths['sentiment_cache'])
+    return True
+
+def graph(paths, params, options):
+    import mapping
+    mapping.main(input=paths['sentiment'], output=paths['sample_data'], graph_dir=paths['graph'])
+    return True
+
+def ingest(paths, params, options):
+    if os.environ.get('KG_BACKEND') == 'memory':
+        # The in-memory backend reads sample_data itself
+        return True
+    url = params['url']
+    if url is None:
+        # LOAD CSV reads file:/// URLs from the Neo4j import directory, so sample_data is copied there
+        if not options['import_dir']:
+            print('Error: ingest needs ingest.import_dir, the Neo4j import directory (or NEO4J_IMPORT_DIR), '
+                  'or ingest.url, a URL Neo4j can read sample_data from')
+            return False
+        name = os.path.basename(paths['sample_data'])
+        shutil.copyfile(paths['sample_data'], os.path.join(options['import_dir'], name))
+        url = 'file:///' + urllib.parse.quote(name)
+    import recommendation
+    return recommendation.main('ingest', url=url)
+
+def triples(paths, params, options):
+    import createDatabase
+    return createDatabase.create_csv_from_json(paths['relations'], paths['nodes'], paths['triples'])
+
+def train(paths, params, options):
+    import doTransE
+    return doTransE.create_csv_from_json(paths['relations'], paths['nodes'], os.path.join(paths['embeddings'], 'triples.csv'),
+                                  embeddings_dir=paths['embeddings'], **params)
+
+def default_stages():
+    return [
+        Stage('scrape', scrape, (), ('crawl', 'scraped'), {'rooturl': 'https://www.imdb.com', 'max_pages': None},
+              {'concurrency': 8, 'rate_per_host': 4.0, 'replay': False, 'max_age': None}),
+        Stage('sentiment', sentiment, ('scraped',), ('sentiment',), {'scorer': 'textblob'}, {'processes': os.cpu_count() or 1}),
+        Stage('graph', graph, ('sentiment',), ('sample_data', 'graph')),
+        Stage('ingest', ingest, ('sample_data',), (), {'url': None}, {'import_dir': os.environ.get('NEO4J_IMPORT_DIR')}),
+        Stage('triples', triples, ('relations', 'nodes'), ('triples',)),
+        Stage('train', train, ('relations', 'nodes'), ('embeddings',),
+              {'embedding_dim': 100, 'epochs': 500, 'learning_rate': 0.1, 'margin': 1.0, 'batch_size': None, 'seed': None}),
+    ]
+
+class Pipeline:
+    """
+    Runs stages in dependency order, skipping those whose fingerprint, a hash
+    of their parameters and of the content of their inputs, matches the one
+    recorded when their outputs were last written.
+
+    A stage depends on the stage writing each of its inputs; inputs no stage
+    writes, such as the JSON exports, must already exist. Stages without
+    inputs, like scrape, only run again when their parameters change or they
+    are forced. The fingerprints, and the digests of files by size and
+    modification time so unchanged files are not hashed again, are kept in
+    <workdir>/.kgrec/state.json.
+
+    Args:
+        workdir (str): Directory every path is relative to.
+        stages (list, optional): The stages. Defaults to default_stages().
+        paths (dict, optional): Overrides of PATHS.
+    """
+
+    def __init__(self, workdir='.', stages=None, paths=None):
+        self.workdir = workdir
+        self.stages = {stage.name: stage for stage in (stages or default_stages())}
+        self.paths = {key: os.path.join(workdir, path) for key, path in {**PATHS, **(paths or {})}.items()}
+        self.producers = {output: stage.name for stage in self.stages.values() for output in stage.outputs}
+        self.state_path = os.path.join(workdir, '.kgrec', 'state.json')
+        self.state = {'stages': {}, 'digests': {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.state['digests'].get(key)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        self.state['digests'][key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def digest(self, key):
+        """Content hash of a file, or of every file under a directory; None when it does not exist."""
+        path = self.paths[key]
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for directory, subdirectories, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                file_path = os.path.join(directory, name)
+                digest.update(f'{os.path.relpath(file_path, path)}\0{self.file_digest(file_path)}\0'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def fingerprint(self, stage):
+        inputs = {key: self.digest(key) for key in stage.inputs}
+        return hashlib.sha256(json.dumps({'stage': stage.name, 'params': stage.params, 'inputs': inputs},
+                                         sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def plan(self, targets=None):
+        """Returns the names of targets and every stage upstream of them, in dependency order."""
+        order, visiting = [], set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f'Stage {name} depends on itself.')
+            visiting.add(name)
+            for key in self.stages[name].inputs:
+                if key in self.producers:
+                    visit(self.producers[key])
+            visiting.discard(name)
+            order.append(name)
+
+        for name in targets or self.stages:
+            if name not in self.stages:
+                raise ValueError(f'Unknown stage {name}, expected one of {", ".join(self.stages)}.')
+            visit(name)
+        return order
+
+    def status(self, name, stale=()):
+        """
+        Why the stage would run, or None when it is up to date. stale holds the
+        stages that will run before it, whose outputs on disk are about to change.
+        """
+        stage = self.stages[name]
+        upstream = [self.producers[key] for key in stage.inputs if self.producers.get(key) in stale]
+        missing = [self.paths[key] for key in stage.inputs if not os.path.exists(self.paths[key])]
+        if missing:
+            return f'upstream {upstream[0]} will run' if upstream else 'missing ' + ', '.join(missing)
+        recorded = self.state['stages'].get(name)
+        if recorded is None:
+            return 'never run'
+        if recorded['fingerprint'] is None:
+            return 'last run failed'
+        if any(not os.path.exists(self.paths[key]) for key in stage.outputs):
+            return 'outputs missing'
+        if recorded['fingerprint'] != self.fingerprint(stage):
+            return 'inputs or parameters changed'
+        if upstream:
+            return f'upstream {upstream[0]} will run'
+        return None
+
+    def statuses(self, targets=None, force=()):
+        """Yields every stage of the plan for targets with why it would run, or None, without running anything."""
+        stale = set()
+        for name in self.plan(targets):
+            reason = 'forced' if name in force else self.status(name, stale)
+            if reason is not None:
+                stale.add(name)
+            yield name, reason
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """
+        Runs every stale stage needed for targets (default: all of them).
+
+        Args:
+            targets (list, optional): Stage names. Defaults to None, every stage.
+            force (iterable, optional): Stages to run even when up to date.
+            dry_run (bool, optional): Only print what would run. Defaults to False.
+
+        Returns:
+            bool: False when a stage failed or lacked an input.
+        """
+        if dry_run:
+            for name, reason in self.statuses(targets, force):
+                print(f'{name}: would run ({reason})' if reason else f'{name}: up to date')
+            self.save_state()
+            return True
+
+        for name in self.plan(targets):
+            stage = self.stages[name]
+            # The stages upstream have run, so the inputs on disk are the ones this stage will read
+            reason = 'forced' if name in force else self.status(name)
+            if reason is None:
+                print(f'{name}: up to date')
+                continue
+            missing = [self.paths[key] for key in stage.inputs if not os.path.exists(self.paths[key])]
+            if missing:
+                print(f'Error: {name} needs {", ".join(missing)}')
+                return False
+
+            print(f'{name}: running ({reason})')
+            fingerprint = self.fingerprint(stage)
+            # Forget the last fingerprint first, so outputs left by an earlier run never pass for
+            # this one's when it fails, returns False or is interrupted
+            self.state['stages'][name] = {'fingerprint': None}
+            self.save_state()
+            if not stage.run(self.paths, stage.params, stage.options):
+                print(f'Error: {name} failed')
+                return False
+            missing = [self.paths[key] for key in stage.outputs if not os.path.exists(self.paths[key])]
+            if missing:
+                print(f'Error: {name} did not write {", ".join(missing)}')
+                return False
+            self.state['stages'][name] = {'fingerprint': fingerprint}
+            self.save_state()
+        # Keeps the digests of the files checked, so they are not hashed again
+        self.save_state()
+        return True
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def load_pipeline(workdir, config=None, settings=()):
+    """
+    Builds the pipeline from the defaults, a JSON config file such as
+    {"paths": {"relations": "export/relations.json"}, "params": {"train": {"epochs": 200}}},
+    and stage.name=value settings, which apply to params or options alike.
+    """
+    config_data = {}
+    if config:
+        with open(config) as f:
+            config_data = json.load(f)
+    stages = default_stages()
+    by_name = {stage.name: stage for stage in stages}
+
+    overrides = [(stage, name, value) for stage, values in config_data.get('params', {}).items() for name, value in values.items()]
+    for setting in settings:
+        target, _, value = setting.partition('=')
+        stage, _, name = target.partition('.')
+        overrides.append((stage, name, parse_value(value)))
+    for stage, name, value in overrides:
+        if stage not in by_name:
+            raise ValueError(f'Unknown stage {stage} in {stage}.{name}.')
+        if name in by_name[stage].options:
+            by_name[stage].options[name] = value
+        elif name in by_name[stage].params:
+            by_name[stage].params[name] = value
+        else:
+            raise ValueError(f'Stage {stage} has no setting {name}.')
+    return Pipeline(workdir, stages, config_data.get('paths'))
+
+def serve(pipeline, what, port=None):
+    if what == 'kg':
+        # The in-memory backend reads the graph stage's output; Neo4j serves what was ingested
+        os.environ.setdefault('KG_DATA', pipeline.paths['sample_data'])
+        import recommendation
+        recommendation.main('serve', index_path=os.path.join(pipeline.workdir, 'index.html'), port=port or 8000)
+    else:
+        import recomendationSystem
+        recomendationSystem.main(pipeline.paths['embeddings'], port=port or 8001)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='kgrec', description='Runs the movie recommendation pipelines, skipping stages whose inputs and parameters are unchanged.')
+    parser.add_argument('--workdir', default='.', help='directory holding every artifact (default: .)')
+    parser.add_argument('--config', help='JSON file with "paths" and per-stage "params"')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='STAGE.NAME=VALUE', help='override a stage setting')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run stale stages')
+    run_parser.add_argument('stages', nargs='*', help='target stages, with everything upstream of them (default: all)')
+    run_parser.add_argument('--force', action='append', default=[], metavar='STAGE', help='run STAGE even if it is up to date')
+    run_parser.add_argument('--dry-run', action='store_true', help='only print what would run')
+
+    commands.add_parser('status', help='print whether every stage is up to date')
+    commands.add_parser('stages', help='list the stages with their inputs, outputs and settings')
+
+    serve_parser = commands.add_parser('serve', help='serve recommendations')
+    serve_parser.add_argument('what', choices=('kg', 'embeddings'))
+    serve_parser.add_argument('--port', type=int)
+
+    args = parser.parse_args(argv)
+    try:
+        pipeline = load_pipeline(args.workdir, args.config, args.settings)
+        if args.command == 'run':
+            return 0 if pipeline.run(args.stages, set(args.force), args.dry_run) else 1
+        if args.command == 'status':
+            for name, reason in pipeline.statuses():
+                print(f'{name}: {reason or "up to date"}')
+            pipeline.save_state()
+        elif args.command == 'stages':
+            for name in pipeline.plan():
+                stage = pipeline.stages[name]
+                print(f'{name}: {", ".join(stage.inputs) or "-"} -> {", ".join(stage.outputs) or "-"}  {json.dumps({**stage.params, **stage.options})}')
+        else:
+            serve(pipeline, args.what, args.port)
+    except ValueError as e:
+        print(f'Error: {e}')
+        return 2
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())